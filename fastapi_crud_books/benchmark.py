@@ -0,0 +1,112 @@
+"""
+BookStore の操作時間の計測
+
+本の件数を増やしながら、作成・取得・更新・削除の1回あたりの時間を計測する。
+件数によらずほぼ一定であれば各操作がO(1)で行えている。
+比較のため、以前の実装(リストの線形探索と max による採番)も小さい件数で計測する。
+--persist-size を指定すると、操作ログ(book_log.py)へ追記する作成のfsync方針ごとの時間と、
+スナップショット・操作ログからの起動時間も計測する。
+
+fastapi_crud_books ディレクトリで実行する:
+    python benchmark.py
+    python benchmark.py --sizes 1000 100000 1000000 --ops 20000
+    python benchmark.py --sizes 1000 --persist-size 1000000
+"""
+import argparse
+import random
+import tempfile
+import time
+from book_schemas import BookSchema, BookResponseShema
+from book_store import BookStore
+from book_log import BookLog
+
+CATEGORIES = ["technical", "comics", "magazine", "novel", "business"]
+
+def make_books(count: int) -> list[BookResponseShema]:
+    return [
+        BookResponseShema.model_construct(id=book_id, title=f"本{book_id}", category=CATEGORIES[book_id % len(CATEGORIES)])
+        for book_id in range(1, count + 1)
+    ]
+
+def per_op_us(func, args_list: list) -> float:
+    started = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - started) / len(args_list) * 1_000_000
+
+def bench_store(size: int, ops: int, rng: random.Random) -> dict[str, float]:
+    store = BookStore(make_books(size))
+    new_book = BookSchema(title="新しい本", category="novel")
+    ids = [rng.randint(1, size) for _ in range(ops)]
+    result = {
+        "get": per_op_us(store.get, [(book_id,) for book_id in ids]),
+        "update": per_op_us(store.update, [(book_id, new_book) for book_id in ids]),
+        "create": per_op_us(store.create, [(new_book,)] * ops),
+    }
+    # 同じidを二重に削除しないよう、重複のないidを選ぶ
+    delete_ids = rng.sample(range(1, size + 1), min(ops, size))
+    result["delete"] = per_op_us(store.delete, [(book_id,) for book_id in delete_ids])
+    return result
+
+def bench_list(size: int, ops: int, rng: random.Random) -> dict[str, float]:
+    """以前の実装と同じ、リストの線形探索による操作"""
+    books = make_books(size)
+    new_book = BookSchema(title="新しい本", category="novel")
+    ids = [rng.randint(1, size) for _ in range(ops)]
+
+    def get(book_id):
+        for book in books:
+            if book.id == book_id:
+                return book
+
+    def create(book):
+        new_book_id = max([book.id for book in books], default=0) + 1
+        books.append(BookResponseShema(id=new_book_id, **book.model_dump()))
+
+    return {
+        "get": per_op_us(get, [(book_id,) for book_id in ids]),
+        "create": per_op_us(create, [(new_book,)] * ops),
+    }
+
+def bench_persistence(size: int, ops: int) -> None:
+    """操作ログへの追記を含む作成の時間と、スナップショット・操作ログからの起動時間を計測する"""
+    new_book = BookSchema(title="新しい本", category="novel")
+    with tempfile.TemporaryDirectory() as directory:
+        log = BookLog(directory, fsync="never", compact_every=size * 2)
+        store = BookStore(make_books(size), log=log)
+        log.compact(store.list(), size + 1)
+        for fsync in ("never", "interval", "always"):
+            log.fsync = fsync
+            # fsyncが毎回発生するalwaysは遅いため回数を減らす
+            count = ops if fsync != "always" else max(ops // 100, 10)
+            print(f"作成(fsync={fsync:<8}){per_op_us(store.create, [(new_book,)] * count):>10.2f}µs")
+        store.close()
+
+        started = time.perf_counter()
+        store = BookStore(log=BookLog(directory))
+        print(f"起動(スナップショット{size}件 + 操作ログ{ops * 2 + max(ops // 100, 10)}件): "
+              f"{time.perf_counter() - started:.2f}s, 復元した件数 {len(store)}")
+        store.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BookStoreの操作時間の計測")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000],
+                        help="計測する本の件数")
+    parser.add_argument("--ops", type=int, default=10_000, help="操作ごとの実行回数")
+    parser.add_argument("--list-max-size", type=int, default=10_000,
+                        help="以前の実装を計測する最大の件数(線形探索のため大きいと時間がかかる)")
+    parser.add_argument("--persist-size", type=int, default=0,
+                        help="操作ログ・スナップショットを計測する本の件数(0の場合は計測しない)")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'実装':<10}{'件数':>10}" + "".join(f"{name:>12}" for name in ("get", "update", "create", "delete")))
+    for size in args.sizes:
+        result = bench_store(size, args.ops, rng)
+        print(f"{'BookStore':<10}{size:>10}" + "".join(f"{result[name]:>10.2f}µs" for name in ("get", "update", "create", "delete")))
+        if size <= args.list_max_size:
+            # 線形探索は1回が重いため、回数を減らして計測する
+            result = bench_list(size, max(args.ops // 100, 10), rng)
+            print(f"{'list':<10}{size:>10}{result['get']:>10.2f}µs{'-':>12}{result['create']:>10.2f}µs{'-':>12}")
+    if args.persist_size:
+        bench_persistence(args.persist_size, args.ops)
@@ -0,0 +1,273 @@
+"""
+本のカタログの永続化(追記専用の操作ログとスナップショット)
+
+BookStore の変更を1行1件のJSON(JSONL)で操作ログに追記し、一定件数ごとに
+その時点の全件をスナップショットに書き出して操作ログを空にする(コンパクション)。
+起動時はスナップショットを読み込んでから操作ログを再生する。どちらもmmapで読む。
+
+    books.snapshot.jsonl : 1行目が {"next_id": N}、2行目以降が本1冊ずつ
+    books.log.jsonl      : {"op": "put", "id": ..., "title": ..., "category": ...} または {"op": "delete", "id": ...}
+    books.lock           : 複数プロセスで書き込みを直列化するためのロックファイル
+
+操作はいずれも「その本をこの状態にする」という冪等な形なので、スナップショットの書き出し後、
+操作ログを空にする前に停止しても、再起動時に古い操作ログを再生して同じ状態に戻る。
+複数のワーカープロセスで同じディレクトリを使う場合は、各プロセスが他のプロセスの追記を読み取って追いつく。
+
+fsyncの方針:
+    always   : 追記のたびにfsyncする。OSが停止しても応答済みの書き込みは失われない
+    interval : 前回のfsyncから fsync_interval 秒以上経っていれば追記時にfsyncする(既定)。
+               経っていなければタイマーで fsync_interval 秒後にfsyncするため、失われうるのは
+               OSが停止する直前の fsync_interval 秒以内の書き込みだけになる
+    never    : fsyncせずOSに任せる。プロセスが落ちても書き込みは残るが、OSの停止では失われうる
+"""
+import fcntl
+import json
+import mmap
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Literal
+from pydantic import TypeAdapter
+from book_schemas import BookResponseShema
+
+FsyncPolicy = Literal["always", "interval", "never"]
+
+SNAPSHOT_FILE = "books.snapshot.jsonl"
+LOG_FILE = "books.log.jsonl"
+LOCK_FILE = "books.lock"
+
+# スナップショットの全件を1つのJSON配列としてまとめて検証し、モデルを組み立てる
+_BOOK_LIST = TypeAdapter(list[BookResponseShema])
+
+@dataclass
+class Changes:
+    """ロックを取ったときに読み取った、他のプロセスによる変更"""
+    # Trueの場合はコンパクションで操作ログが入れ替わったため、recordsで全件を置き換える
+    reset: bool = False
+    records: list[BookResponseShema] = field(default_factory=list)
+    next_id: int = 1
+    ops: list[dict] = field(default_factory=list)
+
+def _iter_lines(path: str) -> Iterator[tuple[int, dict]]:
+    """
+        ファイルを先頭からmmapで読み、(その行の終わりの位置, 行のJSON) を順に返す
+        改行で終わっていない最後の行(書き込み途中で停止した行)は返さない
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                if not line.endswith(b"\n"):
+                    return
+                yield mm.tell(), json.loads(line)
+
+def _read_snapshot(path: str) -> tuple[list[BookResponseShema], int]:
+    """
+        スナップショットをmmapで読み、(本の一覧, next_id) を返す
+        1行ずつ読み込むと件数が多い場合に起動が遅くなるため、各行をつなげた1つのJSON配列として読み込む
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return [], 1
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return [], 1
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header = mm.readline()
+            # 改行で終わっていない最後の行は読まない(スナップショットは置き換えで書くため通常は起きない)
+            body = mm[mm.tell():mm.rfind(b"\n") + 1]
+    # JSONの文字列中の改行はエスケープされているため、行区切りの改行をカンマにすれば配列になる
+    books = _BOOK_LIST.validate_json(b"[" + body.rstrip(b"\n").replace(b"\n", b",") + b"]")
+    return books, json.loads(header)["next_id"]
+
+def _parse_tail(data: bytes) -> tuple[int, list[dict]]:
+    """追記された部分のうち、改行まで書き終わった行だけを読み取る"""
+    end = data.rfind(b"\n") + 1
+    return end, [json.loads(line) for line in data[:end].splitlines() if line]
+
+def _fsync_directory(directory: str) -> None:
+    # ファイルの作成・置き換えをディレクトリのエントリとして確定させる
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class BookLog:
+    """操作ログとスナップショットの読み書きを行うクラス。BookStoreから使う"""
+
+    def __init__(self, directory: str, fsync: FsyncPolicy = "interval",
+                 fsync_interval: float = 1.0, compact_every: int = 100_000):
+        self.directory = directory
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self._thread_lock = threading.Lock()
+        self._lock_file = None
+        self._log_file = None
+        self._log_inode = None
+        self._offset = 0
+        self._ops_since_snapshot = 0
+        self._last_fsync = 0.0
+        # interval の場合に、まだfsyncしていない追記があるか
+        self._dirty = False
+        self._flush_timer: threading.Timer | None = None
+
+    def open(self) -> Changes:
+        """
+            スナップショットと操作ログから状態を復元し、追記できる状態にする関数
+            Returns:
+                Changes: reset=Trueで、スナップショットの全件とnext_id、その後の操作を持つ
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, LOCK_FILE), "a+b")
+        with self._process_lock():
+            return self._load()
+
+    def _load(self) -> Changes:
+        """スナップショットを読み込み、操作ログを再生した結果を返す(プロセス間のロック中に呼ぶ)"""
+        books, next_id = _read_snapshot(self.snapshot_path)
+        end = 0
+        ops = []
+        for end, op in _iter_lines(self.log_path):
+            ops.append(op)
+        self._ops_since_snapshot = len(ops)
+
+        if self._log_file is not None:
+            self._log_file.close()
+        self._log_file = open(self.log_path, "a+b")
+        if os.fstat(self._log_file.fileno()).st_size > end:
+            # 書き込み途中で停止した最後の行を切り捨てる
+            self._log_file.truncate(end)
+        self._log_inode = os.fstat(self._log_file.fileno()).st_ino
+        self._offset = end
+        return Changes(reset=True, records=books, next_id=next_id, ops=ops)
+
+    @contextmanager
+    def _process_lock(self) -> Iterator[None]:
+        with self._thread_lock:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def is_stale(self) -> bool:
+        """他のプロセスが追記またはコンパクションを行い、読み込んでいない変更があるかを返す"""
+        try:
+            stat = os.stat(self.log_path)
+        except FileNotFoundError:
+            return True
+        return stat.st_ino != self._log_inode or stat.st_size != self._offset
+
+    def _catch_up(self) -> Changes:
+        """前回読んだ位置以降に他のプロセスが追記した操作を読み取る(プロセス間のロック中に呼ぶ)"""
+        if os.stat(self.log_path).st_ino != self._log_inode:
+            return self._load()
+        size = os.fstat(self._log_file.fileno()).st_size
+        if size == self._offset:
+            return Changes()
+        data = os.pread(self._log_file.fileno(), size - self._offset, self._offset)
+        end, ops = _parse_tail(data)
+        self._offset += end
+        if end < len(data):
+            # ロック中に改行まで書けていない行は、書き込み中に停止したプロセスのものなので切り捨てる
+            self._log_file.truncate(self._offset)
+        self._ops_since_snapshot += len(ops)
+        return Changes(ops=ops)
+
+    @contextmanager
+    def locked(self) -> Iterator[Changes]:
+        """
+            プロセス間のロックを取り、他のプロセスの変更を読み取ってから処理を行うコンテキストマネージャー
+            append と compact はこの中で呼ぶ
+        """
+        with self._process_lock():
+            yield self._catch_up()
+
+    def append(self, op: dict) -> None:
+        line = json.dumps(op, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+        # O_APPENDのファイルへの1回のwriteなので、行が他のプロセスの追記と混ざらない
+        os.write(self._log_file.fileno(), line)
+        self._offset += len(line)
+        self._ops_since_snapshot += 1
+        if self.fsync == "never":
+            return
+        now = time.monotonic()
+        if self.fsync == "always" or now - self._last_fsync >= self.fsync_interval:
+            os.fdatasync(self._log_file.fileno())
+            self._last_fsync = now
+            self._dirty = False
+            return
+        # 次の追記を待たずに、前回のfsyncから fsync_interval 秒後にfsyncする
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.fsync_interval - (now - self._last_fsync), self._flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush(self) -> None:
+        """タイマーから呼ばれ、まだfsyncしていない追記をfsyncする"""
+        with self._thread_lock:
+            self._flush_timer = None
+            if self._dirty and self._log_file is not None:
+                os.fdatasync(self._log_file.fileno())
+                self._last_fsync = time.monotonic()
+                self._dirty = False
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self._ops_since_snapshot >= self.compact_every
+
+    def compact(self, books: Iterable[BookResponseShema], next_id: int) -> None:
+        """
+            現在の全件をスナップショットに書き出し、操作ログを空にする関数
+            Args:
+                books(Iterable[BookResponseShema]): 現在の全件
+                next_id(int): 次に割り当てるid
+        """
+        snapshot_tmp = self.snapshot_path + ".tmp"
+        with open(snapshot_tmp, "wb") as f:
+            f.write(json.dumps({"next_id": next_id}).encode() + b"\n")
+            f.writelines(book.model_dump_json().encode() + b"\n" for book in books)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(snapshot_tmp, self.snapshot_path)
+
+        # 空の操作ログに入れ替える。他のプロセスはinodeの変化で入れ替わりを検知して読み直す
+        log_tmp = self.log_path + ".tmp"
+        open(log_tmp, "wb").close()
+        os.replace(log_tmp, self.log_path)
+        _fsync_directory(self.directory)
+        self._log_file.close()
+        self._log_file = open(self.log_path, "a+b")
+        self._log_inode = os.fstat(self._log_file.fileno()).st_ino
+        self._offset = 0
+        self._ops_since_snapshot = 0
+        # 入れ替える前の操作ログの内容はfsync済みのスナップショットに含まれている
+        self._dirty = False
+
+    def close(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        with self._thread_lock:
+            self._flush_timer = None
+            if self._log_file is not None:
+                if self.fsync != "never":
+                    os.fdatasync(self._log_file.fileno())
+                self._log_file.close()
+                self._log_file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
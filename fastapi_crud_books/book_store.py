@@ -0,0 +1,138 @@
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from book_schemas import BookSchema, BookResponseShema
+from book_log import BookLog, Changes
+
+class BookStore:
+    """
+        本をメモリ上で管理するストア
+        idをキーにした辞書で1件の取得・更新・削除をO(1)で行い、カテゴリ別の索引で絞り込みを行う。
+        同期のルート関数はスレッドプールで並行に実行されるため、変更はロックで直列化する。
+        logを渡すと変更を操作ログに追記し、再起動後も同じカタログを復元する
+    """
+
+    def __init__(self, books: Iterable[BookResponseShema] = (), log: BookLog | None = None):
+        self._books: dict[int, BookResponseShema] = {}
+        # カテゴリ → そのカテゴリの本のid(登録順を保つため値を使わない辞書を集合として使う)
+        self._by_category: dict[str, dict[int, None]] = {}
+        self._lock = threading.Lock()
+        # idは削除後も再利用せず、単調に増やす
+        self._next_id = 1
+        self._log = log
+        if log is not None:
+            self._apply(log.open())
+        with self._writing():
+            # 他のワーカーが同時に初期データを書き込む場合があるため、ログのロックを取って
+            # 追いついた後で判定する。保存済みのカタログがある場合は初期データを使わない
+            if self._books or self._next_id > 1:
+                books = ()
+            for book in books:
+                self._put(book)
+                self._append_put(book)
+
+    def _index(self, book: BookResponseShema) -> None:
+        self._by_category.setdefault(book.category, {})[book.id] = None
+
+    def _unindex(self, book: BookResponseShema) -> None:
+        ids = self._by_category[book.category]
+        del ids[book.id]
+        if not ids:
+            del self._by_category[book.category]
+
+    def _put(self, book: BookResponseShema) -> None:
+        existing_book = self._books.get(book.id)
+        # 一覧での位置が変わらないよう、辞書の値を置き換える
+        self._books[book.id] = book
+        if existing_book is None or existing_book.category != book.category:
+            if existing_book is not None:
+                self._unindex(existing_book)
+            self._index(book)
+        self._next_id = max(self._next_id, book.id + 1)
+
+    def _pop(self, book_id: int) -> BookResponseShema | None:
+        book = self._books.pop(book_id, None)
+        if book is not None:
+            self._unindex(book)
+        return book
+
+    def _apply(self, changes: Changes) -> None:
+        """他のプロセスが操作ログに書いた変更を反映する"""
+        if changes.reset:
+            self._books.clear()
+            self._by_category.clear()
+            self._next_id = changes.next_id
+            for book in changes.records:
+                self._put(book)
+        for op in changes.ops:
+            if op["op"] == "put":
+                # 自身が検証して書き出した値なので、再検証せずにモデルを組み立てる
+                self._put(BookResponseShema.model_construct(
+                    id=op["id"], title=op["title"], category=op["category"]))
+            else:
+                self._pop(op["id"])
+
+    def _append_put(self, book: BookResponseShema) -> None:
+        if self._log is not None:
+            self._log.append({"op": "put", **book.model_dump()})
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        with self._lock:
+            if self._log is None:
+                yield
+                return
+            with self._log.locked() as changes:
+                self._apply(changes)
+                yield
+                if self._log.needs_compaction:
+                    self._log.compact(self._books.values(), self._next_id)
+
+    def _refresh(self) -> None:
+        # 他のワーカープロセスの変更があれば、読み取りの前に追いつく
+        if self._log is not None and self._log.is_stale():
+            with self._writing():
+                pass
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._books)
+
+    def create(self, book: BookSchema) -> BookResponseShema:
+        with self._writing():
+            new_book = BookResponseShema(id=self._next_id, **book.model_dump())
+            self._put(new_book)
+            self._append_put(new_book)
+        return new_book
+
+    def get(self, book_id: int) -> BookResponseShema | None:
+        self._refresh()
+        return self._books.get(book_id)
+
+    def list(self, category: str | None = None) -> list[BookResponseShema]:
+        self._refresh()
+        # 別スレッドの変更中に辞書を走査しないよう、コピーもロックの中で行う
+        with self._lock:
+            if category is None:
+                return list(self._books.values())
+            return [self._books[book_id] for book_id in self._by_category.get(category, ())]
+
+    def update(self, book_id: int, book: BookSchema) -> BookResponseShema | None:
+        updated_book = BookResponseShema(id=book_id, **book.model_dump())
+        with self._writing():
+            if book_id not in self._books:
+                return None
+            self._put(updated_book)
+            self._append_put(updated_book)
+        return updated_book
+
+    def delete(self, book_id: int) -> BookResponseShema | None:
+        with self._writing():
+            book = self._pop(book_id)
+            if book is not None and self._log is not None:
+                self._log.append({"op": "delete", "id": book_id})
+        return book
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
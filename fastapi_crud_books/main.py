@@ -1,48 +1,62 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from book_schemas import BookSchema, BookResponseShema
+from book_store import BookStore
+from book_log import BookLog
 
-app = FastAPI()
+# カタログの保存先。空にするとメモリ上だけで管理する(再起動で初期データに戻る)
+BOOKS_DATA_DIR = os.getenv("BOOKS_DATA_DIR", os.path.join(os.path.dirname(__file__), "data"))
 
-books: list[BookResponseShema] = [
+books_log = BookLog(
+    BOOKS_DATA_DIR,
+    fsync=os.getenv("BOOKS_FSYNC", "interval"),
+    fsync_interval=float(os.getenv("BOOKS_FSYNC_INTERVAL", "1.0")),
+    compact_every=int(os.getenv("BOOKS_COMPACT_EVERY", "100000")),
+) if BOOKS_DATA_DIR else None
+
+books = BookStore([
     BookResponseShema(id=1, title="Python入門", category="technical"),
     BookResponseShema(id=2, title="はじめてのプログラミング", category="technical"),
     BookResponseShema(id=3, title="すすむ巨人", category="comics"),
     BookResponseShema(id=4, title="DBおやじ", category="comics"),
     BookResponseShema(id=5, title="週刊ダイヤモンド", category="magazine"),
     BookResponseShema(id=6, title="ザ・社長", category="magazine"), 
-]
+], log=books_log)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 書き込み途中の操作ログをfsyncしてから終了する
+    books.close()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.post("/books/", response_model=BookResponseShema)
 def create_book(book: BookSchema):
-    new_book_id = max([book.id for book in books], default=0) + 1
-    new_book = BookResponseShema(id=new_book_id, **book.model_dump())
-    books.append(new_book)
-    return new_book
+    return books.create(book)
 
 @app.get("/books/", response_model=list[BookResponseShema])
-def read_books():
-    return books
+def read_books(category: str | None = None):
+    return books.list(category)
 
 @app.get("/books/{book_id}", response_model=BookResponseShema)
 def read_book(book_id: int):
-    for book in books:
-        if book.id == book_id:
-            return book
-    raise HTTPException(status_code=404, detail="Book not found")
+    book = books.get(book_id)
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book
 
 @app.put("/books/{book_id}", response_model=BookResponseShema)
 def update_book(book_id: int, book: BookSchema):
-    for index, existing_book in enumerate(books):
-        if existing_book.id == book_id:
-            updated_book = BookResponseShema(id=book_id, **book.model_dump())
-            books[index] = updated_book
-            return updated_book
-    raise HTTPException(status_code=404, detail="Book not found")
+    updated_book = books.update(book_id, book)
+    if updated_book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return updated_book
 
 @app.delete("/books/{book_id}", response_model=BookResponseShema)
 def delete_book(book_id: int):
-    for index, book in enumerate(books):
-        if book.id == book_id:
-            books.pop(index)
-            return book
-    raise HTTPException(status_code=404, detail="Book not found")
\ No newline at end of file
+    book = books.delete(book_id)
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book
\ No newline at end of file
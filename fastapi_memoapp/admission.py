@@ -0,0 +1,146 @@
+"""
+DBを使うリクエストの同時実行数の制限(アドミッション制御)
+
+読み取りと書き込みで別々の上限を持ち、上限を超えたリクエストは待ち行列で待たせる。
+待ち行列が一杯の場合と、待ち時間が期限を超えた場合は 503 と Retry-After を返して
+すぐに断り、過負荷時に全員の応答が遅くなるのではなく一部だけが失敗するようにする。
+読み取りはキャッシュで済むものも多いため、上限を接続数より多めにしている。
+
+    MEMOAPP_ADMISSION             : 0で無効にする(既定: 有効)
+    MEMOAPP_ADMISSION_READ_LIMIT  : 同時に処理する読み取りの上限(既定: 32)
+    MEMOAPP_ADMISSION_WRITE_LIMIT : 同時に処理する書き込みの上限(既定: 8)
+    MEMOAPP_ADMISSION_QUEUE       : 読み取り・書き込みそれぞれの待ち行列の上限(既定: 64)
+    MEMOAPP_ADMISSION_TIMEOUT_MS  : 待ち行列で待てる時間(ミリ秒。既定: 1000)
+    MEMOAPP_ADMISSION_RETRY_AFTER : 断ったときに Retry-After で返す秒数(既定: 1)
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
+from fastapi import HTTPException
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+class Overloaded(Exception):
+    """同時実行数の上限に達しており、リクエストを受け付けられない場合の例外"""
+
+class AdmissionLimiter:
+    """同時実行数の上限と、上限待ちの待ち行列の長さ・待ち時間の期限を管理する"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout_ms: float, enabled: bool = True):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout_ms / 1000
+        self.enabled = enabled
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds = 0.0
+
+    async def _acquire(self) -> None:
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return
+        if self.queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise Overloaded(f"{self.name}: 待ち行列が一杯です")
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise Overloaded(f"{self.name}: 待ち時間が上限を超えました") from None
+        finally:
+            self.queued -= 1
+            self.wait_seconds += time.perf_counter() - started
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+            処理枠を確保してから処理を行うコンテキストマネージャー
+            Raises:
+                Overloaded: 待ち行列が一杯の場合、または期限までに処理枠が空かなかった場合
+        """
+        if not self.enabled:
+            yield
+            return
+        await self._acquire()
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_ms_total": round(self.wait_seconds * 1000, 2),
+        }
+
+def _enabled() -> bool:
+    return os.getenv("MEMOAPP_ADMISSION", "1").lower() in ("1", "true", "yes", "on")
+
+read_limiter = AdmissionLimiter(
+    "read",
+    limit=int(os.getenv("MEMOAPP_ADMISSION_READ_LIMIT", "32")),
+    max_queue=int(os.getenv("MEMOAPP_ADMISSION_QUEUE", "64")),
+    timeout_ms=float(os.getenv("MEMOAPP_ADMISSION_TIMEOUT_MS", "1000")),
+    enabled=_enabled(),
+)
+
+write_limiter = AdmissionLimiter(
+    "write",
+    limit=int(os.getenv("MEMOAPP_ADMISSION_WRITE_LIMIT", "8")),
+    max_queue=int(os.getenv("MEMOAPP_ADMISSION_QUEUE", "64")),
+    timeout_ms=float(os.getenv("MEMOAPP_ADMISSION_TIMEOUT_MS", "1000")),
+    enabled=_enabled(),
+)
+
+RETRY_AFTER = os.getenv("MEMOAPP_ADMISSION_RETRY_AFTER", "1")
+
+def service_unavailable() -> HTTPException:
+    """過負荷で断る場合の 503 Service Unavailable と Retry-After を表す例外を返す"""
+    return HTTPException(
+        status_code=503,
+        detail="混み合っているため処理できません。しばらくしてから再度お試しください",
+        headers={"Retry-After": RETRY_AFTER},
+    )
+
+@asynccontextmanager
+async def admit(read_only: bool) -> AsyncIterator[None]:
+    """
+        読み取り・書き込みの処理枠を確保するコンテキストマネージャー
+        確保できない場合は 503 Service Unavailable の HTTPException を送出する
+    """
+    limiter = read_limiter if read_only else write_limiter
+    try:
+        async with limiter.admit():
+            yield
+    except Overloaded as e:
+        logger.debug("リクエストを受け付けられません: %s", e)
+        raise service_unavailable()
+
+async def read_slot():
+    """get_dbsessionを使わずに読み取りを行うルート(エクスポートなど)用の依存関係"""
+    async with admit(read_only=True):
+        yield
+
+def stats() -> dict[str, dict[str, int | float]]:
+    return {"read": read_limiter.stats(), "write": write_limiter.stats()}
@@ -0,0 +1,19 @@
+"""ベンチマーク共通の集計処理"""
+
+def percentile(samples: list[float], pct: float) -> float:
+    """samplesのpctパーセンタイル値(最近傍法)を返す"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+def summarize(latencies: list[float]) -> dict:
+    """レイテンシ(秒)のリストをミリ秒単位の統計値にまとめる"""
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+    }
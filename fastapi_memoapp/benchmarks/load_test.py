@@ -0,0 +1,256 @@
+"""
+メモAPIの負荷試験
+
+アプリをプロセス内のASGIクライアント(httpx.ASGITransport)から呼び出し、
+一時ディレクトリに作ったSQLiteファイルに対して登録・一覧・1件取得・更新・削除を
+指定した比率と並行数で実行する。スループットとp50/p95/p99レイテンシをJSONで出力する。
+
+    list        : 先頭ページの取得
+    list_cursor : due_date・priorityの並び替えでX-Next-Cursorをたどり、奥のページまで読む
+    create      : POST /memos/ による1件の登録(グループコミットが有効ならその経路を通る)
+
+fastapi_memoapp ディレクトリで実行する:
+    python -m benchmarks.load_test --seed-rows 10000 --concurrency 1 8 32 --requests 2000
+    python -m benchmarks.load_test --mix create=1,list=1 --output result.json
+
+グループコミットの効果は、登録だけの比率で有効・無効を切り替えて比べる
+(fsyncの時間は保存先のディスクに依存するため、--data-dir で実際のディスクを指定する):
+    MEMOAPP_DB_SYNCHRONOUS=FULL python -m benchmarks.load_test --mix create=1 --concurrency 1 32
+    MEMOAPP_GROUP_COMMIT=1 python -m benchmarks.load_test --mix create=1 --concurrency 1 32
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import httpx
+from benchmarks.common import summarize
+
+# 操作ごとの実行比率。--mix で上書きできる
+MIXES = {
+    "read_heavy": {"list": 30, "list_cursor": 30, "get": 25, "create": 8, "update": 5, "delete": 2},
+    "balanced": {"list": 15, "list_cursor": 15, "get": 20, "create": 25, "update": 20, "delete": 5},
+    "write_heavy": {"list": 5, "list_cursor": 5, "get": 10, "create": 45, "update": 30, "delete": 5},
+}
+
+# list_cursor でたどる並び替え。memo_id以外の並び替えはカーソル行の値との比較が必要になる
+CURSOR_SORTS = [("due_date", "asc"), ("due_date", "desc"), ("priority", "asc"), ("priority", "desc")]
+
+def parse_mix(text: str) -> dict[str, int]:
+    """'create=1,list=8' 形式の文字列を比率の辞書に変換する"""
+    if text in MIXES:
+        return MIXES[text]
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in MIXES["balanced"]:
+            raise argparse.ArgumentTypeError(f"未知の操作です: {name}")
+        mix[name] = int(weight or 1)
+    return mix
+
+def memo_payload(rng: random.Random) -> dict:
+    return {
+        "title": f"負荷試験{rng.randrange(1_000_000)}",
+        "description": "会議で話すトピック：プロジェクトの進捗状況",
+        "status": {
+            "priority": rng.choice(["高", "中", "低"]),
+            "due_date": f"2025-07-{rng.randint(1, 28):02d}T00:00:00",
+            "is_completed": rng.random() < 0.3,
+        },
+    }
+
+class Workload:
+    """既存のmemo_idを管理しながら、比率どおりに操作を選んで実行する"""
+
+    def __init__(self, client: httpx.AsyncClient, memo_ids: list[int], mix: dict[str, int], seed: int):
+        self.client = client
+        self.memo_ids = memo_ids
+        self.max_known_id = max(memo_ids, default=0)
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.rng = random.Random(seed)
+        # list_cursor でたどっている並び替えと次ページのカーソル
+        self.cursor_sort = CURSOR_SORTS[0]
+        self.cursor: str | None = None
+
+    async def sync_ids(self) -> int:
+        """
+            POST /memos/ はIDを返さないため、計測の合間に既知の最大ID以降をキーセットで読み、
+            登録されたメモのIDを取り込む。取り込んだ件数を返す
+        """
+        added = 0
+        while True:
+            response = await self.client.get("/memos/", params={"limit": 1000, "after": self.max_known_id})
+            response.raise_for_status()
+            memo_ids = [memo["memo_id"] for memo in response.json()]
+            self.memo_ids.extend(memo_ids)
+            added += len(memo_ids)
+            if memo_ids:
+                self.max_known_id = memo_ids[-1]
+            if "X-Next-Cursor" not in response.headers:
+                return added
+
+    async def _list_cursor(self) -> httpx.Response:
+        sort, order = self.cursor_sort
+        params = {"limit": 100, "sort": sort, "order": order}
+        if self.cursor is not None:
+            params["after"] = self.cursor
+        response = await self.client.get("/memos/", params=params)
+        self.cursor = response.headers.get("X-Next-Cursor")
+        if self.cursor is None:
+            # 最後のページまで読んだら、別の並び替えで先頭からたどり直す
+            self.cursor_sort = self.rng.choice(CURSOR_SORTS)
+        return response
+
+    async def run_one(self) -> tuple[str, int]:
+        operation = self.rng.choices(self.operations, self.weights)[0]
+        if operation in ("get", "update", "delete") and not self.memo_ids:
+            operation = "create"
+        if operation == "list":
+            response = await self.client.get("/memos/", params={"limit": 100})
+        elif operation == "list_cursor":
+            response = await self._list_cursor()
+        elif operation == "get":
+            response = await self.client.get(f"/memos/{self.rng.choice(self.memo_ids)}")
+        elif operation == "create":
+            # 採番されたIDは計測の合間に sync_ids で取り込む
+            response = await self.client.post("/memos/", json=memo_payload(self.rng))
+        elif operation == "update":
+            response = await self.client.put(f"/memos/{self.rng.choice(self.memo_ids)}",
+                                             json=memo_payload(self.rng))
+        else:
+            index = self.rng.randrange(len(self.memo_ids))
+            # 同じIDを二重に削除しないよう、送信前に候補から外す
+            memo_id = self.memo_ids[index]
+            self.memo_ids[index] = self.memo_ids[-1]
+            self.memo_ids.pop()
+            response = await self.client.delete(f"/memos/{memo_id}")
+        return operation, response.status_code
+
+async def run_level(workload: Workload, concurrency: int, total_requests: int) -> dict:
+    """total_requests件の操作を並行数concurrencyで実行して集計する"""
+    remaining = total_requests
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                operation, status_code = await workload.run_one()
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            elapsed = time.perf_counter() - started
+            if status_code >= 400:
+                key = f"{operation}:{status_code}"
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies.setdefault(operation, []).append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(all_latencies) / elapsed, 1),
+        "latency": summarize(all_latencies),
+        "operations": {name: summarize(values) for name, values in sorted(latencies.items())},
+        "errors": errors,
+    }
+
+async def seed_database(seed_rows: int) -> list[int]:
+    """テーブルを作成し、seed_rows件のメモを投入してそのIDを返す"""
+    from sqlalchemy import insert, select
+    import db
+    import models.memo as memo_model
+
+    async with db.engine.begin() as conn:
+        await conn.run_sync(db.Base.metadata.create_all)
+        rng = random.Random(0)
+        batch = []
+        for _ in range(seed_rows):
+            payload = memo_payload(rng)
+            batch.append({
+                "title": payload["title"],
+                "description": payload["description"],
+                "priority": payload["status"]["priority"],
+                "due_date": datetime.fromisoformat(payload["status"]["due_date"]),
+                "is_completed": payload["status"]["is_completed"],
+            })
+            if len(batch) == 5000:
+                await conn.execute(insert(memo_model.Memo), batch)
+                batch = []
+        if batch:
+            await conn.execute(insert(memo_model.Memo), batch)
+        result = await conn.execute(select(memo_model.Memo.memo_id))
+        return list(result.scalars().all())
+
+async def main(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(dir=args.data_dir) as workdir:
+        # dbモジュールは読み込み時に接続先を決めるため、アプリを読み込む前に設定する
+        os.environ["MEMOAPP_DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(workdir, "load.sqlite")
+        os.environ.setdefault("MEMOAPP_DB_PROFILE", "production")
+        os.environ.setdefault("MEMOAPP_LOG_LEVEL", "WARNING")
+        app = importlib.import_module("main").create_app()
+        settings = importlib.import_module("db").settings
+        group_commit = importlib.import_module("write_queue").memo_writer.enabled
+
+        memo_ids = await seed_database(args.seed_rows)
+        results = []
+        transport = httpx.ASGITransport(app=app)
+        # ASGITransportはlifespanを送らないため、サーバーと同じ起動・終了処理をここで実行する
+        async with app.router.lifespan_context(app):
+            startup_timings = app.state.startup_timings
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+                workload = Workload(client, memo_ids, args.mix, args.seed)
+                if args.warmup:
+                    await run_level(workload, 1, args.warmup)
+                    await workload.sync_ids()
+                for concurrency in args.concurrency:
+                    results.append(await run_level(workload, concurrency, args.requests))
+                    await workload.sync_ids()
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "db_profile": os.environ["MEMOAPP_DB_PROFILE"],
+        "synchronous": settings.synchronous,
+        "group_commit": group_commit,
+        "seed_rows": args.seed_rows,
+        "startup": startup_timings,
+        "mix": args.mix,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="メモAPIのプロセス内負荷試験")
+    parser.add_argument("--seed-rows", type=int, default=10_000, help="事前に投入するメモの件数")
+    parser.add_argument("--mix", type=parse_mix, default=MIXES["read_heavy"],
+                        help=f"操作の比率。{', '.join(MIXES)} または 'create=1,list=8' 形式")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="計測する並行数")
+    parser.add_argument("--requests", type=int, default=2000, help="並行数ごとのリクエスト数")
+    parser.add_argument("--warmup", type=int, default=100, help="計測前に実行するリクエスト数")
+    parser.add_argument("--seed", type=int, default=42, help="操作を選ぶ乱数のシード")
+    parser.add_argument("--data-dir", help="SQLiteファイルを置く一時ディレクトリの親。省略時はOSの一時ディレクトリ")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル。省略時は標準出力")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
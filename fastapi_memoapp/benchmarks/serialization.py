@@ -0,0 +1,103 @@
+"""
+メモ一覧のシリアライズ処理を比較するベンチマーク
+
+    従来方式: ORMオブジェクトを取得 → 1行ずつMemoSchemaを生成 → response_modelで再検証 → JSON化
+    現行方式: 必要なカラムだけを取得 → 辞書に詰め替え → pydantic-coreで直接JSON化
+              (cruds.memo.get_memo_rows + pydantic_core.to_json)
+
+fastapi_memoapp ディレクトリで実行する:
+    python -m benchmarks.serialization --rows 10000 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import cruds.memo as memo_crud
+import models.memo as memo_model
+from cache import memo_cache
+from db import Base
+from schemas.memo import MemoSchema, MemoStatusSchema, MemoFilterSchema
+
+memo_list_adapter = TypeAdapter(list[MemoSchema])
+
+async def legacy_list(session, rows: int) -> bytes:
+    """カラム指定・直接JSON化を導入する前の一覧処理を再現する"""
+    # 以前のcruds.memo.get_memosと同じく、ORMオブジェクトとして全カラムを読み出す
+    stmt, = await memo_crud.build_memos_queries(session, MemoFilterSchema())
+    result = await session.execute(stmt.limit(rows))
+    memos = result.scalars().all()
+    memo_schemas = [
+        MemoSchema(
+            memo_id=memo.memo_id,
+            title=memo.title,
+            description=memo.description,
+            status=MemoStatusSchema(
+                priority=memo.priority,
+                due_date=memo.due_date,
+                is_completed=memo.is_completed
+            )
+        )
+        for memo in memos
+    ]
+    # FastAPIがresponse_modelに対して行う処理(辞書化→再検証→JSON互換化→json.dumps)
+    content = [memo_schema.model_dump() for memo_schema in memo_schemas]
+    validated = memo_list_adapter.validate_python(content)
+    return json.dumps(jsonable_encoder(memo_list_adapter.dump_python(validated, mode="json")),
+                      ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+async def fast_list(session, rows: int) -> bytes:
+    memo_rows = await memo_crud.get_memo_rows(session, MemoFilterSchema(), limit=rows)
+    return to_json(memo_rows)
+
+async def measure(session_factory, func, rows: int, repeat: int) -> dict:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        # キャッシュに当たるとシリアライズ以外の比較になるため毎回空にする
+        memo_cache.invalidate()
+        async with session_factory() as session:
+            started = time.perf_counter()
+            body = await func(session, rows)
+            timings.append(time.perf_counter() - started)
+        size = len(body)
+    return {"best_ms": round(min(timings) * 1000, 1),
+            "median_ms": round(sorted(timings)[len(timings) // 2] * 1000, 1),
+            "bytes": size}
+
+async def main(row_counts: list[int], repeat: int) -> None:
+    report = []
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(workdir, "bench.sqlite"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            base_date = datetime(2025, 7, 1)
+            await conn.execute(insert(memo_model.Memo), [
+                {"title": f"メモ{i}", "description": "会議で話すトピック：プロジェクトの進捗状況",
+                 "priority": "高中低"[i % 3], "due_date": base_date + timedelta(days=i % 30),
+                 "is_completed": i % 4 == 0}
+                for i in range(max(row_counts))
+            ])
+        session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        for rows in row_counts:
+            legacy = await measure(session_factory, legacy_list, rows, repeat)
+            fast = await measure(session_factory, fast_list, rows, repeat)
+            report.append({"rows": rows, "legacy": legacy, "fast": fast,
+                           "speedup": round(legacy["median_ms"] / fast["median_ms"], 2)})
+        await engine.dispose()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="メモ一覧のシリアライズ比較")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000],
+                        help="1レスポンスに含める行数")
+    parser.add_argument("--repeat", type=int, default=5, help="各ケースの試行回数")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,127 @@
+"""
+メモの更新・削除処理のレイテンシを比較するベンチマーク
+
+    従来方式: SELECT → ORMオブジェクトを変更 → COMMIT (更新はさらに refresh の SELECT) の往復
+    現行方式: UPDATE ... RETURNING の1文 (cruds.memo.update_memo / delete_memo。削除は論理削除)
+
+fastapi_memoapp ディレクトリで実行する:
+    python -m benchmarks.write_path --rows 2000 --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import cruds.memo as memo_crud
+import models.memo as memo_model
+from benchmarks.common import percentile
+from db import Base
+from schemas.memo import UpsertMemoSchema, MemoStatusSchema
+
+async def legacy_select_memo(db_session: AsyncSession, memo_id: int) -> memo_model.Memo | None:
+    """
+        キャッシュ導入前のget_memo_by_idと同じく、毎回SELECTで取得する
+        (現行のget_memo_by_idはキャッシュ済みの、セッションに属さないオブジェクトを返すことがあり、
+        変更してもUPDATEが発行されないため使わない)
+    """
+    Memo = memo_model.Memo
+    return await db_session.scalar(
+        select(Memo).where(Memo.memo_id == memo_id, Memo.deleted_at.is_(None))
+    )
+
+async def legacy_update_memo(db_session: AsyncSession, memo_id: int, target_data: UpsertMemoSchema):
+    """RETURNING導入前のupdate_memoと同じ手順で更新する"""
+    memo = await legacy_select_memo(db_session, memo_id)
+    if memo:
+        memo.title = target_data.title
+        memo.description = target_data.description
+        memo.updated_at = datetime.now()
+        memo.priority = target_data.status.priority
+        memo.due_date = target_data.status.due_date
+        memo.is_completed = target_data.status.is_completed
+        await db_session.commit()
+        await db_session.refresh(memo)
+    return memo
+
+async def legacy_delete_memo(db_session: AsyncSession, memo_id: int):
+    """
+        RETURNING導入前のdelete_memoと同じ手順(SELECT → 変更 → COMMIT)で削除する
+        現行のdelete_memoと同じ操作を比べるため、物理削除ではなくdeleted_atを設定する論理削除にする
+    """
+    memo = await legacy_select_memo(db_session, memo_id)
+    if memo:
+        memo.deleted_at = datetime.now()
+        await db_session.commit()
+    return memo
+
+async def run_case(session_factory, operation, memo_ids: list[int], concurrency: int) -> dict:
+    """memo_idsを並行数concurrencyで処理し、1操作あたりのレイテンシを集計する"""
+    queue = list(memo_ids)
+    latencies: list[float] = []
+    errors = 0
+    payload = UpsertMemoSchema(title="benchmark", description="updated",
+                               status=MemoStatusSchema(priority="高"))
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            memo_id = queue.pop()
+            started = time.perf_counter()
+            try:
+                async with session_factory() as session:
+                    await operation(session, memo_id, payload)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "ops": len(latencies),
+        "errors": errors,
+        "throughput_ops": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+    }
+
+async def main(rows: int, concurrency_levels: list[int]) -> None:
+    cases = {
+        "update/legacy": legacy_update_memo,
+        "update/returning": memo_crud.update_memo,
+        "delete/legacy": lambda session, memo_id, _: legacy_delete_memo(session, memo_id),
+        "delete/returning": lambda session, memo_id, _: memo_crud.delete_memo(session, memo_id),
+    }
+    report = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for concurrency in concurrency_levels:
+            for name, operation in cases.items():
+                # ケースごとに新しいDBファイルを用意し、条件を揃える
+                path = os.path.join(workdir, f"{name.replace('/', '_')}_{concurrency}.sqlite")
+                engine = create_async_engine("sqlite+aiosqlite:///" + path,
+                                             pool_size=concurrency, max_overflow=0)
+                async with engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+                    await conn.execute(insert(memo_model.Memo), [
+                        {"title": f"memo{i}", "description": "", "priority": "低"}
+                        for i in range(rows)
+                    ])
+                session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+                result = await run_case(session_factory, operation, list(range(1, rows + 1)), concurrency)
+                await engine.dispose()
+                report.append({"case": name, "concurrency": concurrency, **result})
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="メモ更新・削除のレイテンシ比較")
+    parser.add_argument("--rows", type=int, default=2000, help="ケースごとに処理する行数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32],
+                        help="計測する並行数")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.concurrency))
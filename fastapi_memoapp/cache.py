@@ -0,0 +1,105 @@
+"""
+メモの読み取りキャッシュ
+
+cruds.memo の読み取り関数の前段に置くプロセス内キャッシュ。
+TTL付きのLRUで件数を制限し、書き込み関数から明示的に無効化する。
+ワーカープロセスごとに独立しているため、他プロセスの書き込みはTTLの範囲で遅れて反映される。
+"""
+import os
+from typing import Any, Hashable
+from cachetools import TTLCache
+
+class CountingTTLCache(TTLCache):
+    """ヒット・ミス・追い出しの回数を数えるTTL付きLRUキャッシュ"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def popitem(self):
+        # 容量超過でLRUの末尾が追い出されるときに呼ばれる
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.expirations += len(expired)
+        return expired
+
+    def clear(self):
+        # clear()も内部でpopitem()を使うため、無効化による削除を追い出しとして数えない
+        evictions = self.evictions
+        super().clear()
+        self.evictions = evictions
+
+    def lookup(self, key: Hashable) -> Any | None:
+        """キーに対応する値を返す。存在しない・期限切れの場合はNone"""
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self),
+            "maxsize": int(self.maxsize),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+class MemoCache:
+    """
+        メモ1件単位のキャッシュと一覧ページ単位のキャッシュをまとめたクラス
+
+        書き込みと読み取りが競合したとき、書き込み前に読んだ古い値を
+        書き込み後に保存してしまわないよう、世代番号で保存可否を判定する
+    """
+
+    def __init__(self, maxsize: int, list_maxsize: int, ttl: float):
+        self.enabled = maxsize > 0 and list_maxsize > 0
+        self.items = CountingTTLCache(max(maxsize, 1), ttl)
+        self.lists = CountingTTLCache(max(list_maxsize, 1), ttl)
+        self.generation = 0
+
+    def get_memo(self, memo_id: int) -> Any | None:
+        return self.items.lookup(memo_id) if self.enabled else None
+
+    def set_memo(self, memo_id: int, memo: Any, generation: int) -> None:
+        if self.enabled and memo is not None and generation == self.generation:
+            self.items[memo_id] = memo
+
+    def get_list(self, key: Hashable) -> Any | None:
+        return self.lists.lookup(key) if self.enabled else None
+
+    def set_list(self, key: Hashable, memos: Any, generation: int) -> None:
+        if self.enabled and generation == self.generation:
+            self.lists[key] = memos
+
+    def invalidate(self, memo_ids: list[int] | set[int] = ()) -> None:
+        """
+            書き込み後に呼び出し、影響を受けるキャッシュを破棄する関数
+            Args:
+                memo_ids(list[int] | set[int]): 変更されたメモのID。該当する1件キャッシュだけを破棄する
+        """
+        self.generation += 1
+        for memo_id in memo_ids:
+            self.items.pop(memo_id, None)
+        # 一覧はどのページに変更が波及するか特定できないため全て破棄する
+        self.lists.clear()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {"items": self.items.stats(), "lists": self.lists.stats()}
+
+memo_cache = MemoCache(
+    maxsize=int(os.getenv("MEMOAPP_CACHE_MAXSIZE", "10000")),
+    list_maxsize=int(os.getenv("MEMOAPP_CACHE_LIST_MAXSIZE", "256")),
+    ttl=float(os.getenv("MEMOAPP_CACHE_TTL", "30")),
+)
@@ -0,0 +1,164 @@
+"""
+メモの変更通知(チェンジフィード)
+
+cruds.memo の書き込み関数がCOMMIT後に publish し、購読中のクライアント
+(Server-Sent Events・WebSocket)へ変更されたメモのIDを配信する。
+クライアントは一覧をポーリングする代わりに、通知を受けたメモだけを取得し直せばよい。
+
+各イベントには「<エポック>-<連番>」形式のIDを付ける。再接続時にこのIDを渡すと、
+履歴に残っている分の取りこぼしを再送する。履歴から溢れている・プロセスが再起動して
+エポックが変わっているなど再送できない場合は、一覧の再取得を促す reset イベントを送る。
+
+配信が追いつかないクライアントはバッファが上限に達した時点で切り離し、reset イベントを送って終了する。
+キャッシュと同じくワーカープロセスごとに独立しているため、複数ワーカーで動かす場合は
+接続先のワーカーで行われた書き込みだけが通知される。
+
+    MEMOAPP_CHANGEFEED_HISTORY      : 再送用に保持するイベント数(既定: 1024)
+    MEMOAPP_CHANGEFEED_BUFFER       : クライアントごとの未送信イベントの上限(既定: 256)
+    MEMOAPP_CHANGEFEED_HEARTBEAT_S  : イベントがないときに接続維持の通知を送る間隔(秒。既定: 15)
+"""
+import asyncio
+import os
+import uuid
+from collections import deque
+from collections.abc import AsyncIterator, Iterable
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Literal
+from pydantic_core import to_json
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+ChangeType = Literal["created", "updated", "deleted", "reset"]
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """1回の書き込みで変更されたメモの通知"""
+    id: str
+    seq: int
+    type: ChangeType
+    memo_ids: tuple[int, ...] = ()
+    at: datetime = field(default_factory=datetime.now)
+
+    def to_json(self) -> bytes:
+        return to_json({
+            "id": self.id, "seq": self.seq, "type": self.type,
+            "memo_ids": self.memo_ids, "at": self.at,
+        })
+
+class Subscription:
+    """1クライアント分の未送信イベントのバッファ"""
+
+    def __init__(self, maxsize: int):
+        self._queue: asyncio.Queue[ChangeEvent] = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def _offer(self, event: ChangeEvent) -> bool:
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def _drop(self, reset: ChangeEvent) -> None:
+        # 未送信分を捨て、再取得を促すイベントだけを残して配信を打ち切る
+        self.dropped = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(reset)
+
+    async def events(self, heartbeat: float) -> AsyncIterator[ChangeEvent | None]:
+        """
+            イベントを順に返す非同期イテレーター
+            heartbeat秒イベントがなければNoneを返す。切り離された場合はresetイベントを返して終了する
+        """
+        while True:
+            try:
+                event = await asyncio.wait_for(self._queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            yield event
+            if self.dropped and self._queue.empty():
+                return
+
+class ChangeFeed:
+    """書き込みの通知を連番付きで記録し、購読中のクライアントへ配る"""
+
+    def __init__(self, history_size: int, buffer_size: int, heartbeat: float):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.seq = 0
+        self.dropped = 0
+        self._history: deque[ChangeEvent] = deque(maxlen=history_size)
+        self._subscribers: set[Subscription] = set()
+
+    def _event(self, seq: int, change_type: ChangeType, memo_ids: Iterable[int] = ()) -> ChangeEvent:
+        return ChangeEvent(id=f"{self.epoch}-{seq}", seq=seq, type=change_type,
+                           memo_ids=tuple(sorted(memo_ids)))
+
+    def publish(self, change_type: ChangeType, memo_ids: Iterable[int] = ()) -> ChangeEvent | None:
+        """
+            書き込みのCOMMIT後に呼び出し、変更を購読中のクライアントへ配る関数
+            Args:
+                change_type(ChangeType): 変更の種類。resetは全件の再取得が必要な変更(一括取り込みなど)
+                memo_ids(Iterable[int]): 変更されたメモのID
+            Returns:
+                ChangeEvent | None: 記録したイベント。通知する変更がない場合はNone
+        """
+        memo_ids = tuple(memo_ids)
+        if not memo_ids and change_type != "reset":
+            return None
+        self.seq += 1
+        event = self._event(self.seq, change_type, memo_ids)
+        self._history.append(event)
+        for subscription in list(self._subscribers):
+            if not subscription._offer(event):
+                self._subscribers.discard(subscription)
+                subscription._drop(self._event(self.seq, "reset"))
+                self.dropped += 1
+                logger.warning("変更通知の配信が追いつかないクライアントを切り離しました")
+        return event
+
+    def _parse_event_id(self, last_event_id: str) -> int | None:
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscribe(self, last_event_id: str | None = None) -> Subscription:
+        """
+            変更通知の購読を開始する関数
+            Args:
+                last_event_id(str | None): 最後に受け取ったイベントのID。指定した場合はそれ以降のイベントを再送する
+            Returns:
+                Subscription: 購読したクライアントのバッファ。終了時は unsubscribe に渡す
+        """
+        subscription = Subscription(self.buffer_size)
+        if last_event_id:
+            last_seq = self._parse_event_id(last_event_id)
+            oldest_seq = self._history[0].seq if self._history else self.seq + 1
+            missed = [event for event in self._history if last_seq is not None and event.seq > last_seq]
+            if (last_seq is None or last_seq > self.seq or last_seq < oldest_seq - 1
+                    or len(missed) > self.buffer_size):
+                # 取りこぼしを再送できないため、一覧の再取得を促す
+                subscription._offer(self._event(self.seq, "reset"))
+            else:
+                for event in missed:
+                    subscription._offer(event)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def stats(self) -> dict[str, int]:
+        return {"seq": self.seq, "subscribers": len(self._subscribers), "dropped": self.dropped}
+
+change_feed = ChangeFeed(
+    history_size=int(os.getenv("MEMOAPP_CHANGEFEED_HISTORY", "1024")),
+    buffer_size=int(os.getenv("MEMOAPP_CHANGEFEED_BUFFER", "256")),
+    heartbeat=float(os.getenv("MEMOAPP_CHANGEFEED_HEARTBEAT_S", "15")),
+)
@@ -1,12 +1,14 @@
 import asyncio
-from db import engine, Base
-from models.memo import Memo
+from db import engine
+from schema import ensure_schema
 
 async def create_tables():
-    """データベースのテーブルを作成する関数"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """データベースのテーブルを作成する関数。既存のデータベースには不足しているカラムやインデックスを追加する"""
+    changes = await ensure_schema(engine, "create")
+    for change in changes:
+        print(f">>> {change}")
     print("テーブルが正常に作成されました！")
+    await engine.dispose()
 
 if __name__ == "__main__":
-    asyncio.run(create_tables()) 
\ No newline at end of file
+    asyncio.run(create_tables())
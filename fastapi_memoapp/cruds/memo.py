@@ -1,54 +1,289 @@
-from sqlalchemy import select
+from collections.abc import AsyncIterator
+from sqlalchemy import select, Select, insert, update, and_, or_, text, func, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.util.concurrency import AsyncAdaptedLock
 import schemas.memo as memo_schema
 import models.memo as memo_model
+from cache import memo_cache
+from changefeed import change_feed
+from logger import get_logger
+from write_queue import memo_writer
 from datetime import datetime
 
+logger = get_logger(__name__)
+
+def _memo_values(memo_data: memo_schema.UpsertMemoSchema) -> dict:
+    """スキーマをmemosテーブルのカラム名に対応した辞書に変換する"""
+    return {
+        "title": memo_data.title,
+        "description": memo_data.description,
+        "priority": memo_data.status.priority,
+        "due_date": memo_data.status.due_date,
+        "is_completed": memo_data.status.is_completed,
+    }
+
 async def insert_memo(
     db_session: AsyncSession,
     memo_data: memo_schema.UpsertMemoSchema) -> memo_model.Memo:
     """
         新しいメモをデータベースに登録する関数
+        グループコミットが有効な場合は書き込みキューに積み、他のリクエストの登録とまとめてCOMMITする
         Args:
             db_session(AsyncSession): 非同期DBセッション
             memo_data(UpsertMemoSchema): 作成するメモのデータ
         Returns:
             Memo: 作成されたメモのモデル
     """
+    logger.debug("新規登録：開始")
+    if memo_writer.enabled:
+        new_memo = await memo_writer.submit(_memo_values(memo_data))
+        memo_cache.invalidate()
+        change_feed.publish("created", [new_memo.memo_id])
+        logger.debug("データ追加完了(グループコミット)")
+        return new_memo
     try:
-        print("=== 新規登録：開始 ===")
-        new_memo = memo_model.Memo(
-            title=memo_data.title,
-            description=memo_data.description,
-            priority=memo_data.status.priority,
-            due_date=memo_data.status.due_date,
-            is_completed=memo_data.status.is_completed
-        )
+        new_memo = memo_model.Memo(**_memo_values(memo_data))
         db_session.add(new_memo)
         await db_session.commit()
+        memo_cache.invalidate()
         await db_session.refresh(new_memo)
-        print(">>> データ追加完了")
+        change_feed.publish("created", [new_memo.memo_id])
+        logger.debug("データ追加完了")
         return new_memo
     except Exception as e:
-        print(f"エラーが発生しました: {e}")
         await db_session.rollback()
         raise e
 
-async def get_memos(db_session: AsyncSession) -> list[memo_model.Memo]:
+# 一覧の並び替えに使えるカラム。いずれもインデックスの先頭または主キーに対応する
+_SORT_COLUMNS = {
+    "memo_id": memo_model.Memo.memo_id,
+    "due_date": memo_model.Memo.due_date,
+    "priority": memo_model.Memo.priority,
+}
+
+def _keyset_segments(column, value, after: int, descending: bool) -> list:
+    """
+        (並び替えカラム, memo_id) の組でカーソルより後ろの行を、並び順に続く区間ごとの条件のリストで返す関数
+        区間内は行値の比較にして、インデックスの範囲検索でカーソルの位置から読み始められるようにする。
+        SQLiteではNULLが昇順で先頭、降順で末尾に並ぶ。NULLの区間を同じ条件にORでつなぐと
+        範囲検索にならず先頭から走査してしまうため、NULLの区間は別の条件(別のクエリ)にする
+    """
+    memo_id = memo_model.Memo.memo_id
+    if value is None:
+        # カーソルがNULLの区間にある場合:同じ区間の残りと、昇順ならその後ろの値のある区間
+        if descending:
+            return [and_(column.is_(None), memo_id < after)]
+        return [and_(column.is_(None), memo_id > after), column.is_not(None)]
+    # 行値の比較はカラムがNULLの行を含まない
+    if descending:
+        segments = [tuple_(column, memo_id) < tuple_(value, after)]
+        if column.expression.nullable:
+            segments.append(column.is_(None))
+        return segments
+    return [tuple_(column, memo_id) > tuple_(value, after)]
+
+async def build_memos_queries(
+    db_session: AsyncSession,
+    filters: memo_schema.MemoFilterSchema,
+    after: int | None = None) -> list[Select]:
+    """
+        絞り込み・並び替え・キーセットページネーションを反映した一覧取得用のクエリを組み立てる関数
+        カーソルの後ろにNULLの区間をまたぐ場合は、区間ごとのクエリに分けて返す
+        Args:
+            db_session(AsyncSession): 非同期DBセッション(カーソル行の並び替えキーの取得に使う)
+            filters(MemoFilterSchema): 絞り込みと並び替えの条件
+            after(int | None): 前ページ最後のmemo_id(カーソル)。Noneの場合は先頭から
+        Returns:
+            list[Select]: 順に実行して結果をつなげると並び順どおりになるSELECT文のリスト
+        Raises:
+            ValueError: カーソルに指定したメモが存在しない場合
+    """
+    Memo = memo_model.Memo
+    stmt = select(Memo).where(Memo.deleted_at.is_(None))
+    if filters.priority is not None:
+        stmt = stmt.where(Memo.priority == filters.priority)
+    if filters.is_completed is not None:
+        stmt = stmt.where(Memo.is_completed == filters.is_completed)
+    if filters.due_from is not None:
+        stmt = stmt.where(Memo.due_date >= filters.due_from)
+    if filters.due_to is not None:
+        stmt = stmt.where(Memo.due_date < filters.due_to)
+
+    column = _SORT_COLUMNS[filters.sort]
+    descending = filters.order == "desc"
+    if column is Memo.memo_id:
+        stmt = stmt.order_by(Memo.memo_id.desc() if descending else Memo.memo_id)
+        if after is not None:
+            stmt = stmt.where(Memo.memo_id < after if descending else Memo.memo_id > after)
+        return [stmt]
+
+    if descending:
+        stmt = stmt.order_by(column.desc(), Memo.memo_id.desc())
+    else:
+        stmt = stmt.order_by(column, Memo.memo_id)
+    if after is None:
+        return [stmt]
+    # カーソル行の並び替えキーを主キー検索で取り出す
+    # (直前に論理削除された行もカーソルとして使えるよう、削除済みかどうかは問わない)
+    result = await db_session.execute(select(column).where(Memo.memo_id == after))
+    row = result.first()
+    if row is None:
+        raise ValueError(f"カーソルに指定したメモ(memo_id={after})が存在しません")
+    return [stmt.where(segment) for segment in _keyset_segments(column, row[0], after, descending)]
+
+# 一覧レスポンスに必要なカラム。ORMオブジェクトを組み立てずに行のまま読み出す
+_LIST_COLUMNS = (
+    memo_model.Memo.memo_id,
+    memo_model.Memo.title,
+    memo_model.Memo.description,
+    memo_model.Memo.priority,
+    memo_model.Memo.due_date,
+    memo_model.Memo.is_completed,
+)
+
+def _row_to_dict(row) -> dict:
+    """SELECTした行をMemoSchemaと同じ入れ子の形の辞書に変換する"""
+    memo_id, title, description, priority, due_date, is_completed = row
+    return {
+        "title": title,
+        "description": description,
+        "status": {
+            "priority": priority,
+            "due_date": due_date,
+            "is_completed": is_completed,
+        },
+        "memo_id": memo_id,
+    }
+
+async def get_memo_rows(
+    db_session: AsyncSession,
+    filters: memo_schema.MemoFilterSchema = memo_schema.MemoFilterSchema(),
+    limit: int = 100,
+    after: int | None = None) -> list[dict]:
+    """
+        一覧レスポンスに必要なカラムだけを取得し、レスポンスの形の辞書で返す関数
+        Args:
+            db_session(AsyncSession): 非同期DBセッション
+            filters(MemoFilterSchema): 絞り込みと並び替えの条件
+            limit(int): 1ページあたりの最大件数
+            after(int | None): 前ページ最後のmemo_id(カーソル)。Noneの場合は先頭ページ
+        Returns:
+            list[dict]: MemoSchemaと同じ形の辞書のリスト
+        Raises:
+            ValueError: カーソルに指定したメモが存在しない場合
+    """
+    cache_key = ("rows", filters, limit, after)
+    cached = memo_cache.get_list(cache_key)
+    if cached is not None:
+        return list(cached)
+    logger.debug("ページ取得(カラム指定)：開始")
+    generation = memo_cache.generation
+    rows = []
+    # NULLの区間をまたぐ場合は、前の区間で1ページに満たなかった分を次の区間から読む
+    for stmt in await build_memos_queries(db_session, filters, after):
+        result = await db_session.execute(stmt.with_only_columns(*_LIST_COLUMNS).limit(limit - len(rows)))
+        rows.extend(_row_to_dict(row) for row in result)
+        if len(rows) >= limit:
+            break
+    memo_cache.set_list(cache_key, tuple(rows), generation)
+    logger.debug("データページ取得完了")
+    return rows
+
+async def stream_memo_rows(
+    db_session: AsyncSession,
+    queries: list[Select],
+    chunk_size: int = 500) -> AsyncIterator[list[dict]]:
+    """
+        クエリの結果をサーバーサイドカーソルでchunk_size件ずつ返す非同期ジェネレータ
+        Args:
+            db_session(AsyncSession): 非同期DBセッション
+            queries(list[Select]): build_memos_queriesで組み立てたSELECT文のリスト(順に実行する)
+            chunk_size(int): 一度に取り出す行数
+        Yields:
+            list[dict]: MemoSchemaと同じ形の辞書のリスト(クエリの並び順どおり)
+    """
+    for query in queries:
+        result = await db_session.stream(
+            query.with_only_columns(*_LIST_COLUMNS).execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.partitions():
+            yield [_row_to_dict(row) for row in partition]
+
+# trigramトークナイザーで索引を引ける最小の文字数
+FTS_MIN_TOKEN_LENGTH = 3
+
+async def search_memos(
+    db_session: AsyncSession,
+    query: str,
+    limit: int = 20,
+    offset: int = 0) -> list[memo_model.Memo]:
     """
-        データベースから全てのメモを取得する関数
+        タイトルと詳細を全文検索し、関連度の高い順にメモを返す関数
+        空白で区切った語はすべて含むもの(AND)を返す。
+        3文字未満の語はtrigramの索引を引けないため、LIKEによる部分一致で絞り込む
         Args:
             db_session(AsyncSession): 非同期DBセッション
+            query(str): 検索語
+            limit(int): 1ページあたりの最大件数
+            offset(int): 読み飛ばす件数
         Returns:
-            list[Memo]: 取得された全てのメモのリスト
+            list[Memo]: 検索にヒットしたメモのリスト
     """
-    print("=== 全件取得：開始 ===")
-    result = await db_session.execute(select(memo_model.Memo))
+    logger.debug("全文検索：開始")
+    Memo = memo_model.Memo
+    terms = query.split()
+    long_terms = [term for term in terms if len(term) >= FTS_MIN_TOKEN_LENGTH]
+    short_terms = [term for term in terms if len(term) < FTS_MIN_TOKEN_LENGTH]
+
+    if long_terms:
+        # 各語をフレーズとして引用符で囲み、FTS5の構文として解釈されないようにする
+        match = " AND ".join('"' + term.replace('"', '""') + '"' for term in long_terms)
+        stmt = (
+            select(Memo)
+            .join(memo_model.memos_fts, memo_model.memos_fts.c.rowid == Memo.memo_id)
+            .where(text("memos_fts MATCH :match").bindparams(match=match))
+            .order_by(memo_model.memos_fts.c.rank)
+        )
+    else:
+        stmt = select(Memo).order_by(Memo.memo_id)
+    # 全文検索の索引には物理削除されるまで論理削除済みの行も残っている
+    stmt = stmt.where(Memo.deleted_at.is_(None))
+    for term in short_terms:
+        stmt = stmt.where(or_(Memo.title.contains(term, autoescape=True),
+                              Memo.description.contains(term, autoescape=True)))
+
+    result = await db_session.execute(stmt.limit(limit).offset(offset))
     memos = list(result.scalars().all())
-    print(">>> データ全件取得完了")
+    logger.debug("全文検索完了")
     return memos
 
+async def get_memo_stats(db_session: AsyncSession) -> memo_schema.MemoStatsSchema:
+    """
+        メモの件数の集計を返す関数
+        件数はトリガーで更新される集計テーブルから読み、全件を数え直さない。
+        期限切れの件数だけは現在時刻に依存するため、(is_completed, due_date)のインデックスで数える
+        Args:
+            db_session(AsyncSession): 非同期DBセッション
+        Returns:
+            MemoStatsSchema: 集計結果
+    """
+    result = await db_session.execute(select(memo_model.MemoStat.key, memo_model.MemoStat.count))
+    counts = dict(result.tuples().all())
+    overdue = await db_session.scalar(
+        select(func.count())
+        .select_from(memo_model.Memo)
+        .where(memo_model.Memo.is_completed == False,
+               memo_model.Memo.due_date < datetime.now(),
+               memo_model.Memo.deleted_at.is_(None))
+    )
+    return memo_schema.MemoStatsSchema(
+        total=counts.get("total", 0),
+        open=counts.get("open", 0),
+        completed=counts.get("completed", 0),
+        overdue=overdue,
+        by_priority={key.removeprefix("priority:"): count
+                     for key, count in counts.items() if key.startswith("priority:") and count},
+    )
+
 async def get_memo_by_id(
     db_session: AsyncSession,
     memo_id: int) -> memo_model.Memo | None:
@@ -60,12 +295,18 @@ async def get_memo_by_id(
         Returns:
             Memo | None: 取得されたメモのモデル、メモが存在しない場合はNoneを返す
     """
-    print("=== 1件取得：開始 ===")
+    cached = memo_cache.get_memo(memo_id)
+    if cached is not None:
+        return cached
+    logger.debug("1件取得：開始")
+    generation = memo_cache.generation
     result = await db_session.execute(
-        select(memo_model.Memo).where(memo_model.Memo.memo_id == memo_id)
+        select(memo_model.Memo).where(memo_model.Memo.memo_id == memo_id,
+                                      memo_model.Memo.deleted_at.is_(None))
     )
     memo = result.scalars().first()
-    print(">>> データ取得完了")
+    memo_cache.set_memo(memo_id, memo, generation)
+    logger.debug("データ取得完了")
     return memo
 
 async def update_memo(
@@ -74,6 +315,7 @@ async def update_memo(
     target_data: memo_schema.UpsertMemoSchema) -> memo_model.Memo | None:
     """
         データベースのメモを更新する関数
+        UPDATE ... RETURNING の1文で更新と更新後の値の取得を行う
         Args:
             db_session(AsyncSession): 非同期DBセッション
             memo_id(int): 更新するメモのID(プライマリキー)
@@ -81,35 +323,211 @@ async def update_memo(
         Returns:
             Memo | None: 更新されたメモのモデル、メモが存在しない場合はNoneを返す
     """
-    print("=== データ更新：開始 ===")
-    memo = await get_memo_by_id(db_session, memo_id)
-    if memo:
-        memo.title = target_data.title
-        memo.description = target_data.description
-        memo.updated_at = datetime.now()
-        memo.priority=target_data.status.priority
-        memo.due_date=target_data.status.due_date
-        memo.is_completed=target_data.status.is_completed
+    logger.debug("データ更新：開始")
+    try:
+        result = await db_session.execute(
+            update(memo_model.Memo)
+            .where(memo_model.Memo.memo_id == memo_id, memo_model.Memo.deleted_at.is_(None))
+            .values(updated_at=datetime.now(), **_memo_values(target_data))
+            .returning(memo_model.Memo)
+        )
+        memo = result.scalars().first()
         await db_session.commit()
-        await db_session.refresh(memo)
-        print(">>> データ更新完了")
-    
+    except Exception:
+        await db_session.rollback()
+        raise
+    if memo:
+        memo_cache.invalidate([memo_id])
+        change_feed.publish("updated", [memo_id])
+        logger.debug("データ更新完了")
     return memo
 
+async def get_patch_changes(
+    db_session: AsyncSession,
+    memo_id: int,
+    patch_data: memo_schema.PatchMemoSchema) -> dict | None:
+    """
+        部分更新で実際に値が変わる項目を求める関数
+        変更がなければ書き込み用の接続を使わずに済むよう、読み取り用のセッションで判定する
+        (キャッシュは他のワーカーの更新を反映していない場合があるため、DBから読む)
+        Args:
+            db_session(AsyncSession): 非同期DBセッション(読み取り用でよい)
+            memo_id(int): 更新するメモのID(プライマリキー)
+            patch_data(PatchMemoSchema): 更新する項目だけを含むデータ
+        Returns:
+            dict | None: 値が変わる項目のカラム名と新しい値、メモが存在しない場合はNone
+    """
+    Memo = memo_model.Memo
+    values = patch_data.model_dump(exclude_unset=True)
+    values.update(values.pop("status", None) or {})
+    memo = await db_session.scalar(
+        select(Memo).where(Memo.memo_id == memo_id, Memo.deleted_at.is_(None))
+    )
+    if memo is None:
+        return None
+    return {name: value for name, value in values.items() if getattr(memo, name) != value}
+
+async def patch_memo(
+    db_session: AsyncSession,
+    memo_id: int,
+    changes: dict) -> bool | None:
+    """
+        データベースのメモのうち、指定された項目だけを更新する関数
+        get_patch_changes で判定した後に他のリクエストが更新した場合に備え、
+        WHERE句でも現在値との差分を判定する
+        Args:
+            db_session(AsyncSession): 非同期DBセッション
+            memo_id(int): 更新するメモのID(プライマリキー)
+            changes(dict): 更新するカラム名と値(get_patch_changes の戻り値)
+        Returns:
+            bool | None: 更新した場合はTrue、変更がなかった場合はFalse、メモが存在しない場合はNone
+    """
+    logger.debug("部分更新：開始")
+    Memo = memo_model.Memo
+
+    if changes:
+        try:
+            result = await db_session.execute(
+                update(Memo)
+                .where(Memo.memo_id == memo_id, Memo.deleted_at.is_(None))
+                .where(or_(*(getattr(Memo, name).is_distinct_from(value) for name, value in changes.items())))
+                .values(updated_at=datetime.now(), **changes)
+                .returning(Memo.memo_id)
+            )
+            updated = result.first() is not None
+            await db_session.commit()
+        except Exception:
+            await db_session.rollback()
+            raise
+        if updated:
+            memo_cache.invalidate([memo_id])
+            change_feed.publish("updated", [memo_id])
+            logger.debug("部分更新完了")
+            return True
+
+    # 書き込みがなかった場合は、変更なしか対象が存在しないかを判定する
+    exists = await db_session.scalar(
+        select(Memo.memo_id).where(Memo.memo_id == memo_id, Memo.deleted_at.is_(None))
+    )
+    return False if exists is not None else None
+
 async def delete_memo(db_session: AsyncSession, memo_id: int) -> memo_model.Memo | None:
     """
-        データベースのメモを削除する関数
+        データベースのメモを論理削除する関数
+        deleted_atを設定する UPDATE ... RETURNING の1文で削除と削除した行の取得を行う。
+        行の物理削除はメンテナンス処理(maintenance.py)がまとめて行う
         Args:
             db_session(AsyncSession): 非同期DBセッション
             memo_id(int): 削除するメモのID(プライマリキー)
         Returns:
             Memo | None: 削除されたメモのモデル、メモが存在しない場合はNoneを返す
     """
-    print("=== データ削除：開始 ===")
-    memo = await get_memo_by_id(db_session, memo_id)
+    logger.debug("データ削除：開始")
+    try:
+        result = await db_session.execute(
+            update(memo_model.Memo)
+            .where(memo_model.Memo.memo_id == memo_id, memo_model.Memo.deleted_at.is_(None))
+            .values(deleted_at=datetime.now())
+            .returning(memo_model.Memo)
+        )
+        memo = result.scalars().first()
+        await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        raise
     if memo:
-        await db_session.delete(memo)
+        memo_cache.invalidate([memo_id])
+        change_feed.publish("deleted", [memo_id])
+        logger.debug("データ削除完了")
+    return memo
+
+async def insert_memos(
+    db_session: AsyncSession,
+    memos_data: list[memo_schema.UpsertMemoSchema]) -> list[int]:
+    """
+        複数のメモを1つのINSERT文・1トランザクションで登録する関数
+        Args:
+            db_session(AsyncSession): 非同期DBセッション
+            memos_data(list[UpsertMemoSchema]): 作成するメモのデータのリスト
+        Returns:
+            list[int]: 採番されたmemo_idのリスト(memos_dataと同じ順序)
+    """
+    logger.debug("一括登録：開始")
+    try:
+        result = await db_session.execute(
+            insert(memo_model.Memo).returning(
+                memo_model.Memo.memo_id, sort_by_parameter_order=True
+            ),
+            [_memo_values(memo_data) for memo_data in memos_data]
+        )
+        memo_ids = list(result.scalars().all())
+        await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        raise
+    memo_cache.invalidate()
+    change_feed.publish("created", memo_ids)
+    logger.debug("一括登録完了")
+    return memo_ids
+
+async def update_memos(
+    db_session: AsyncSession,
+    memos_data: list[memo_schema.MemoSchema]) -> set[int]:
+    """
+        複数のメモを主キー指定のexecutemanyで1トランザクションで更新する関数
+        Args:
+            db_session(AsyncSession): 非同期DBセッション
+            memos_data(list[MemoSchema]): memo_idを含む更新データのリスト
+        Returns:
+            set[int]: 更新できたmemo_idの集合。含まれないIDは存在しなかったもの
+    """
+    logger.debug("一括更新：開始")
+    try:
+        target_ids = {memo_data.memo_id for memo_data in memos_data}
+        result = await db_session.execute(
+            select(memo_model.Memo.memo_id).where(memo_model.Memo.memo_id.in_(target_ids),
+                                                  memo_model.Memo.deleted_at.is_(None))
+        )
+        found_ids = set(result.scalars().all())
+        now = datetime.now()
+        parameters = [
+            {"memo_id": memo_data.memo_id, "updated_at": now, **_memo_values(memo_data)}
+            for memo_data in memos_data if memo_data.memo_id in found_ids
+        ]
+        if parameters:
+            await db_session.execute(update(memo_model.Memo), parameters)
         await db_session.commit()
-        print(">>> データ削除完了")
-    
-    return memo
\ No newline at end of file
+    except Exception:
+        await db_session.rollback()
+        raise
+    memo_cache.invalidate(found_ids)
+    change_feed.publish("updated", found_ids)
+    logger.debug("一括更新完了")
+    return found_ids
+
+async def delete_memos(db_session: AsyncSession, memo_ids: list[int]) -> set[int]:
+    """
+        複数のメモを1つのUPDATE文・1トランザクションで論理削除する関数
+        Args:
+            db_session(AsyncSession): 非同期DBセッション
+            memo_ids(list[int]): 削除するメモのIDのリスト
+        Returns:
+            set[int]: 削除できたmemo_idの集合。含まれないIDは存在しなかったもの
+    """
+    logger.debug("一括削除：開始")
+    try:
+        result = await db_session.execute(
+            update(memo_model.Memo)
+            .where(memo_model.Memo.memo_id.in_(set(memo_ids)), memo_model.Memo.deleted_at.is_(None))
+            .values(deleted_at=datetime.now())
+            .returning(memo_model.Memo.memo_id)
+        )
+        deleted_ids = set(result.scalars().all())
+        await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        raise
+    memo_cache.invalidate(deleted_ids)
+    change_feed.publish("deleted", deleted_ids)
+    logger.debug("一括削除完了")
+    return deleted_ids
@@ -1,19 +1,160 @@
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+import admission
 
 Base = declarative_base()
 
 base_dir = os.path.dirname(__file__)
-DATABASE_URL = 'sqlite+aiosqlite:///' + os.path.join(base_dir, 'memodb.sqlite')
+DATABASE_URL = os.getenv(
+    "MEMOAPP_DATABASE_URL",
+    'sqlite+aiosqlite:///' + os.path.join(base_dir, 'memodb.sqlite')
+)
+
+@dataclass(frozen=True)
+class EngineSettings:
+    """エンジンとSQLiteのPRAGMAの設定値"""
+    # 発行するSQLをログに出すかどうか。create_async_engineのechoではなく
+    # logger.enable_sql_logging でアプリケーションのロガーから出力する
+    echo: bool
+    journal_mode: str
+    synchronous: str
+    busy_timeout_ms: int
+    mmap_size: int
+    cache_size: int
+    read_pool_size: int
+    pool_timeout: float
+
+# プロファイルごとの既定値。個々の値は環境変数で上書きできる
+PROFILES: dict[str, EngineSettings] = {
+    "development": EngineSettings(
+        echo=False,
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        busy_timeout_ms=5000,
+        mmap_size=0,
+        cache_size=-2000,
+        read_pool_size=2,
+        pool_timeout=30.0,
+    ),
+    "production": EngineSettings(
+        echo=False,
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        busy_timeout_ms=5000,
+        mmap_size=256 * 1024 * 1024,
+        cache_size=-64 * 1024,
+        read_pool_size=8,
+        pool_timeout=10.0,
+    ),
+}
+
+# メモ登録のグループコミット(write_queue.py)を使うかどうか
+GROUP_COMMIT = os.getenv("MEMOAPP_GROUP_COMMIT", "0").lower() in ("1", "true", "yes", "on")
+
+def load_settings() -> EngineSettings:
+    """
+        環境変数からエンジン設定を読み込む関数
+        MEMOAPP_DB_PROFILE でプロファイルを選び、MEMOAPP_DB_<項目名> で個別に上書きする
+        WALモードのsynchronous=NORMALはCOMMITごとにfsyncしないため、プロセスが落ちても登録は残るが
+        OSの停止・電源断では直前のCOMMITが失われうる。グループコミットはCOMMITごとのfsyncを
+        まとめて減らすためのものなので、有効な場合は既定で synchronous=FULL にする
+        Returns:
+            EngineSettings: 読み込んだ設定
+    """
+    profile = PROFILES[os.getenv("MEMOAPP_DB_PROFILE", "development")]
+    overrides = {}
+    for name, field in EngineSettings.__dataclass_fields__.items():
+        value = os.getenv(f"MEMOAPP_DB_{name.upper()}")
+        if value is None:
+            continue
+        if field.type is bool:
+            overrides[name] = value.lower() in ("1", "true", "yes", "on")
+        else:
+            overrides[name] = field.type(value) if field.type is not str else value
+    if GROUP_COMMIT:
+        overrides.setdefault("synchronous", "FULL")
+    return EngineSettings(**{**profile.__dict__, **overrides})
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+settings = load_settings()
+
+def _register_pragmas(async_engine: AsyncEngine, read_only: bool) -> None:
+    """接続が開かれるたびにSQLiteのPRAGMAを設定するイベントを登録する"""
+    if async_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            # 空き領域を少しずつ返却できるようにする(テーブル作成前の新しいファイルにだけ効く)
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute(f"PRAGMA journal_mode={settings.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.busy_timeout_ms}")
+        cursor.execute(f"PRAGMA mmap_size={settings.mmap_size}")
+        cursor.execute(f"PRAGMA cache_size={settings.cache_size}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+# 書き込み用エンジン：SQLiteの書き込みは同時に1つしか進まないため、接続を1本に絞り
+# ロック待ちではなくプールの待ち行列で直列化する
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=settings.pool_timeout,
+)
+_register_pragmas(engine, read_only=False)
+
+# 読み取り専用エンジン：WALモードでは書き込み中でも読み取りがブロックされない
+read_engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=settings.read_pool_size,
+    max_overflow=0,
+    pool_timeout=settings.pool_timeout,
+)
+_register_pragmas(read_engine, read_only=True)
 
 async_session = async_sessionmaker(
     bind=engine,
     expire_on_commit=False
 )
 
-async def get_dbsession():
-    async with async_session() as session:
-        yield session
\ No newline at end of file
+async_read_session = async_sessionmaker(
+    bind=read_engine,
+    expire_on_commit=False
+)
+
+# データを変更しないHTTPメソッド。これらは読み取り専用エンジンで処理する
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+async def get_dbsession(request: Request):
+    read_only = request.method in READ_METHODS
+    session_factory = async_read_session if read_only else async_session
+    # 同時実行数の上限を超えた分はセッションを開く前に待たせ、待ちきれなければ503で断る
+    async with admission.admit(read_only):
+        async with session_factory() as session:
+            yield session
+
+async def get_read_dbsession():
+    """
+        HTTPメソッドによらず読み取り専用エンジンのセッションを返す依存関係
+        書き込みが必要かを先に読み取りで判定し、必要な場合だけ write_session で書き込むルート用
+    """
+    async with admission.admit(read_only=True):
+        async with async_read_session() as session:
+            yield session
+
+@asynccontextmanager
+async def write_session() -> AsyncIterator[AsyncSession]:
+    """書き込みの処理枠を確保してから、書き込み用エンジンのセッションを開くコンテキストマネージャー"""
+    async with admission.admit(read_only=False):
+        async with async_session() as session:
+            yield session
@@ -0,0 +1,142 @@
+"""
+一覧レスポンスの表現形式と圧縮の選択
+
+Accept ヘッダーで JSON配列(application/json) と NDJSON(application/x-ndjson, 1行1件) を切り替え、
+Accept-Encoding に gzip が含まれていれば圧縮する。アプリ全体のミドルウェアではなく、
+一覧のように大きくなるレスポンスを返すルートから個別に使う。
+
+小さいレスポンスは圧縮してもほとんど縮まずCPU時間だけがかかるため、しきい値未満は圧縮しない。
+ストリーミングのレスポンスは全体の大きさが分からないため常に圧縮し、チャンクごとにフラッシュする。
+
+    MEMOAPP_GZIP_MIN_SIZE : 圧縮する最小のサイズ(バイト。既定: 1024)
+    MEMOAPP_GZIP_LEVEL    : 圧縮レベル(1-9。既定: 5)
+"""
+import os
+import zlib
+from collections.abc import AsyncIterator
+from typing import Literal
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+
+GZIP_MIN_SIZE = int(os.getenv("MEMOAPP_GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("MEMOAPP_GZIP_LEVEL", "5"))
+
+ListFormat = Literal["json", "ndjson"]
+
+MEDIA_TYPES: dict[ListFormat, str] = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+# 表現形式と圧縮の両方がリクエストヘッダーで変わることをキャッシュに伝える
+VARY = "Accept, Accept-Encoding"
+
+def _parse_quality(value: str) -> dict[str, float]:
+    """'gzip;q=0.8, br' 形式のヘッダーを値と品質係数の辞書に変換する"""
+    qualities = {}
+    for part in value.split(","):
+        token, *params = [item.strip() for item in part.split(";")]
+        if not token:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        qualities[token.lower()] = quality
+    return qualities
+
+def accepts_gzip(request: Request) -> bool:
+    qualities = _parse_quality(request.headers.get("accept-encoding", ""))
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+def negotiate_format(request: Request) -> ListFormat:
+    """Acceptヘッダーから一覧の表現形式を選ぶ。NDJSONが明示的に優先されている場合だけNDJSONにする"""
+    qualities = _parse_quality(request.headers.get("accept", ""))
+    ndjson = max(qualities.get("application/x-ndjson", 0.0), qualities.get("application/jsonl", 0.0))
+    json_array = max(qualities.get("application/json", 0.0), qualities.get("*/*", 0.0))
+    return "ndjson" if ndjson > 0 and ndjson >= json_array else "json"
+
+def encode_rows(rows: list[dict], list_format: ListFormat) -> bytes:
+    if list_format == "ndjson":
+        return b"".join(to_json(row) + b"\n" for row in rows)
+    return to_json(rows)
+
+def encode_chunks(chunks: AsyncIterator[list[dict]], list_format: ListFormat) -> AsyncIterator[bytes]:
+    """行のチャンクを、つなげると1つの文書になるバイト列の断片に変換する"""
+    if list_format == "ndjson":
+        return _ndjson_chunks(chunks)
+    return _json_array_chunks(chunks)
+
+async def _ndjson_chunks(chunks: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield b"".join(to_json(row) + b"\n" for row in rows)
+
+async def _json_array_chunks(chunks: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    yield b"["
+    first = True
+    async for rows in chunks:
+        if not rows:
+            continue
+        # チャンクを配列としてエンコードし、外側の括弧を外してつなげる
+        yield (b"" if first else b",") + to_json(rows)[1:-1]
+        first = False
+    yield b"]"
+
+async def _gzip_chunks(chunks: AsyncIterator[bytes], level: int) -> AsyncIterator[bytes]:
+    # wbits=31でgzip形式のヘッダーとフッターを付ける
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        # 受け取った分をすぐにクライアントが展開できるよう、チャンクごとに同期フラッシュする
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _headers(headers: dict[str, str] | None, compressed: bool) -> dict[str, str]:
+    headers = {**(headers or {}), "Vary": VARY}
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+    return headers
+
+def list_response(request: Request, rows: list[dict], headers: dict[str, str] | None = None) -> Response:
+    """
+        一覧をリクエストに合わせた形式でエンコードし、しきい値以上なら圧縮して返す関数
+        Args:
+            request(Request): Accept・Accept-Encodingヘッダーを持つリクエスト
+            rows(list[dict]): MemoSchemaと同じ形の辞書のリスト
+            headers(dict[str, str] | None): 追加で返すヘッダー
+        Returns:
+            Response: エンコード済みのレスポンス
+    """
+    list_format = negotiate_format(request)
+    body = encode_rows(rows, list_format)
+    compressed = len(body) >= GZIP_MIN_SIZE and accepts_gzip(request)
+    if compressed:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        body = compressor.compress(body) + compressor.flush()
+    return Response(content=body, media_type=MEDIA_TYPES[list_format],
+                    headers=_headers(headers, compressed))
+
+def streaming_list_response(request: Request, chunks: AsyncIterator[list[dict]],
+                            headers: dict[str, str] | None = None) -> StreamingResponse:
+    """
+        行のチャンクを逐次エンコード・圧縮して送るレスポンスを返す関数
+        Args:
+            request(Request): Accept・Accept-Encodingヘッダーを持つリクエスト
+            chunks(AsyncIterator[list[dict]]): MemoSchemaと同じ形の辞書のリストを順に返すイテレーター
+            headers(dict[str, str] | None): 追加で返すヘッダー
+        Returns:
+            StreamingResponse: 逐次送信するレスポンス
+    """
+    list_format = negotiate_format(request)
+    body: AsyncIterator[bytes] = encode_chunks(chunks, list_format)
+    compressed = accepts_gzip(request)
+    if compressed:
+        body = _gzip_chunks(body, GZIP_LEVEL)
+    return StreamingResponse(body, media_type=MEDIA_TYPES[list_format],
+                             headers=_headers(headers, compressed))
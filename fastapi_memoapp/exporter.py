@@ -0,0 +1,107 @@
+"""
+メモのArrow/Parquet形式でのエクスポート
+
+memosテーブルをサーバーサイドカーソルでチャンクごとに読み出し、
+Arrowのレコードバッチに変換して書き出した分だけを順に返す。
+テーブル全体をメモリに載せないため、件数が増えてもメモリ使用量はチャンクサイズで決まる。
+"""
+from collections.abc import AsyncIterator
+from typing import Literal
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+import models.memo as memo_model
+
+ExportFormat = Literal["arrow", "parquet"]
+
+# エクスポートするカラムとArrowの型
+EXPORT_COLUMNS = (
+    (memo_model.Memo.memo_id, pa.int64()),
+    (memo_model.Memo.title, pa.string()),
+    (memo_model.Memo.description, pa.string()),
+    (memo_model.Memo.priority, pa.string()),
+    (memo_model.Memo.due_date, pa.timestamp("us")),
+    (memo_model.Memo.is_completed, pa.bool_()),
+    (memo_model.Memo.created_at, pa.timestamp("us")),
+    (memo_model.Memo.updated_at, pa.timestamp("us")),
+)
+EXPORT_SCHEMA = pa.schema([(column.key, arrow_type) for column, arrow_type in EXPORT_COLUMNS])
+
+MEDIA_TYPES: dict[str, str] = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+FILE_EXTENSIONS: dict[str, str] = {"arrow": "arrows", "parquet": "parquet"}
+
+class _ChunkSink:
+    """書き込まれたバイト列を溜めておき、drain()で取り出せるファイル風オブジェクト"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _to_record_batch(rows) -> pa.RecordBatch:
+    """SELECTした行のリストを列ごとの配列に組み替えてレコードバッチにする"""
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, EXPORT_SCHEMA)],
+        schema=EXPORT_SCHEMA,
+    )
+
+async def iter_export(
+    session_factory: async_sessionmaker,
+    export_format: ExportFormat,
+    chunk_size: int = 20_000) -> AsyncIterator[bytes]:
+    """
+        メモ全件を指定形式に変換し、書き出したバイト列をチャンクごとに返す非同期ジェネレータ
+        Args:
+            session_factory(async_sessionmaker): 読み出しに使うセッションの生成元
+            export_format(ExportFormat): 'arrow'(Arrow IPCストリーム) または 'parquet'
+            chunk_size(int): 1回に読み出す行数。Parquetでは1行グループの行数になる
+        Yields:
+            bytes: 出力ファイルの断片
+    """
+    sink = _ChunkSink()
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(sink, EXPORT_SCHEMA, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, EXPORT_SCHEMA)
+
+    query = (
+        select(*(column for column, _ in EXPORT_COLUMNS))
+        .where(memo_model.Memo.deleted_at.is_(None))
+        .order_by(memo_model.Memo.memo_id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async with session_factory() as session:
+        result = await session.stream(query)
+        async for partition in result.partitions():
+            writer.write_batch(_to_record_batch(partition))
+            data = sink.drain()
+            if data:
+                yield data
+    # Parquetのフッター、Arrowの終端マーカーを書き出す
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,27 @@
+import argparse
+import asyncio
+import time
+from db import async_session
+from importer import import_memos
+
+async def main(path: str, import_format: str, batch_size: int):
+    print(f"=== メモの取り込みを開始: {path} ===")
+    started = time.perf_counter()
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        async with async_session() as session:
+            report = await import_memos(session, f, import_format, batch_size=batch_size)
+    print(f">>> {report.inserted}件を登録しました({time.perf_counter() - started:.2f}秒)")
+    if report.rejected:
+        print(f">>> {report.rejected}件の不正な行をスキップしました")
+        for error in report.errors:
+            print(f"    {error['line']}行目: {error['detail']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CSV/JSONLファイルからメモを一括登録する")
+    parser.add_argument("path", help="取り込むファイルのパス")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="ファイル形式。省略時は拡張子から判定する")
+    parser.add_argument("--batch-size", type=int, default=1000, help="1回のINSERTで登録する件数")
+    args = parser.parse_args()
+    import_format = args.format or ("csv" if args.path.lower().endswith(".csv") else "jsonl")
+    asyncio.run(main(args.path, import_format, args.batch_size))
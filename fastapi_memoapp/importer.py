@@ -0,0 +1,145 @@
+"""
+CSV/JSONL形式のメモの一括取り込み
+
+ファイルを先頭から順に読み、batch_size件ずつUpsertMemoSchemaで検証してから
+executemanyでINSERTする。検証に失敗した行は取り込みを中断せずに記録し、
+commit_every バッチごとにCOMMITするため、トランザクションの数は数個に収まる。
+
+CSVの列: title, description, priority, due_date, is_completed
+JSONLの行: UpsertMemoSchemaと同じ形(status入り)、またはCSVと同じ平らな形
+"""
+import csv
+import json
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import Literal, TextIO
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import models.memo as memo_model
+from schemas.memo import UpsertMemoSchema
+from cache import memo_cache
+from changefeed import change_feed
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+ImportFormat = Literal["csv", "jsonl"]
+
+# レポートに詳細を載せる不正な行の上限
+MAX_REPORTED_ERRORS = 100
+
+@dataclass
+class ImportReport:
+    inserted: int = 0
+    rejected: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+    def reject(self, line: int, detail: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "detail": detail})
+
+def _to_payload(record: dict) -> dict:
+    """平らな形のレコードをUpsertMemoSchemaの入れ子の形にそろえる"""
+    if "status" in record:
+        return record
+    return {
+        "title": record.get("title"),
+        "description": record.get("description") or "",
+        "status": {
+            "priority": record.get("priority"),
+            "due_date": record.get("due_date") or None,
+            "is_completed": record.get("is_completed") or False,
+        },
+    }
+
+def iter_records(stream: TextIO, import_format: ImportFormat) -> Iterator[tuple[int, dict | str]]:
+    """
+        ファイルから1件ずつ(行番号, レコード)を返すジェネレータ
+        読み取れない行はレコードの代わりにエラーメッセージを返す
+    """
+    if import_format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, _to_payload(record)
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, f"JSONとして解析できません: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, "JSONオブジェクトではありません"
+            continue
+        yield line_number, _to_payload(record)
+
+async def _insert_batch(db_session: AsyncSession, rows: list[dict]) -> None:
+    # ORMを介さずテーブルに対するexecutemanyで登録する
+    await db_session.execute(insert(memo_model.Memo.__table__), rows)
+
+async def import_memos(
+    db_session: AsyncSession,
+    stream: TextIO,
+    import_format: ImportFormat,
+    batch_size: int = 1000,
+    commit_every: int = 100) -> ImportReport:
+    """
+        CSV/JSONLのメモを取り込む関数
+        Args:
+            db_session(AsyncSession): 非同期DBセッション
+            stream(TextIO): 読み込むファイル
+            import_format(ImportFormat): 'csv' または 'jsonl'
+            batch_size(int): 1回のexecutemanyで登録する件数
+            commit_every(int): COMMITするまでにまとめるバッチ数
+        Returns:
+            ImportReport: 登録件数と不正な行の一覧
+    """
+    report = ImportReport()
+    batch: list[dict] = []
+    pending_batches = 0
+    try:
+        for line_number, record in iter_records(stream, import_format):
+            if isinstance(record, str):
+                report.reject(line_number, record)
+                continue
+            try:
+                memo = UpsertMemoSchema.model_validate(record)
+            except ValidationError as e:
+                report.reject(line_number, "; ".join(
+                    f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
+                ))
+                continue
+            batch.append({
+                "title": memo.title,
+                "description": memo.description,
+                "priority": memo.status.priority,
+                "due_date": memo.status.due_date,
+                "is_completed": memo.status.is_completed,
+            })
+            if len(batch) >= batch_size:
+                await _insert_batch(db_session, batch)
+                report.inserted += len(batch)
+                batch = []
+                pending_batches += 1
+                if pending_batches >= commit_every:
+                    await db_session.commit()
+                    pending_batches = 0
+                    logger.debug("取り込み：%d件をCOMMIT", report.inserted)
+        if batch:
+            await _insert_batch(db_session, batch)
+            report.inserted += len(batch)
+        await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        raise
+    finally:
+        # 途中でCOMMIT済みのバッチがあるため、失敗した場合もキャッシュを破棄する
+        if report.inserted:
+            memo_cache.invalidate()
+            # 件数が多く個別のIDを配ると購読側のバッファを溢れさせるため、一覧の再取得を促す
+            change_feed.publish("reset")
+    return report
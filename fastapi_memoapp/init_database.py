@@ -1,12 +1,6 @@
-import os
-from sqlalchemy.ext.asyncio import create_async_engine
-from models.memo import Base
 import asyncio
-
-base_dir = os.path.dirname(__file__)
-DATABASE_URL = 'sqlite+aiosqlite:///' + os.path.join(base_dir, 'memodb.sqlite')
-
-engine = create_async_engine(DATABASE_URL, echo=True)
+from db import engine
+from models.memo import Base
 
 async def init_db():
     print('=== データベースの初期化を開始 ===')
@@ -16,6 +10,7 @@ async def init_db():
         # テーブルを作成
         await conn.run_sync(Base.metadata.create_all)
         print(">>> 新しいテーブルを作成しました。")
+    await engine.dispose()
 
 if __name__ == "__main__":
     asyncio.run(init_db())
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+アプリケーション共通のロガー設定
+
+ログはJSON形式の1行として出力する。出力はQueueHandler経由で別スレッドに任せ、
+リクエスト処理中にstderrへの書き込みを待たないようにしている。
+ログレベルは環境変数 MEMOAPP_LOG_LEVEL で指定する(既定: INFO)。
+発行したSQLはDEBUGの場合(または MEMOAPP_DB_ECHO=1 の場合)だけ、同じ形式で出力する。
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# 処理中のリクエストのID。ミドルウェアが設定し、ログの各行に付与する
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+LOGGER_NAME = "memoapp"
+
+# LogRecordが標準で持つ属性。これ以外の属性はextraで渡された項目として出力する
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """LogRecordを1行のJSONに変換するフォーマッター"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            payload["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key != "request_id":
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class RequestIdFilter(logging.Filter):
+    """ログ出力時点のリクエストIDをLogRecordに記録するフィルター"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+def setup_logging(level: str | None = None) -> logging.Logger:
+    """
+        アプリケーションのロガーを設定する関数。複数回呼ばれても設定は1度だけ行う
+        Args:
+            level(str | None): ログレベル。Noneの場合は環境変数 MEMOAPP_LOG_LEVEL を使う
+        Returns:
+            Logger: アプリケーションのルートロガー
+    """
+    app_logger = logging.getLogger(LOGGER_NAME)
+    app_logger.setLevel((level or os.getenv("MEMOAPP_LOG_LEVEL", "INFO")).upper())
+    if app_logger.handlers:
+        return app_logger
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # リクエストIDはキューに入れる前(呼び出し元のコンテキスト)で確定させる
+    queue_handler.addFilter(RequestIdFilter())
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app_logger.addHandler(queue_handler)
+    app_logger.propagate = False
+    return app_logger
+
+def get_logger(name: str) -> logging.Logger:
+    """アプリケーションのロガー配下の子ロガーを返す"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+def enable_sql_logging() -> None:
+    """SQLAlchemyが発行するSQLを、アプリケーションのロガーと同じハンドラーからJSONで出力する"""
+    sql_logger = logging.getLogger("sqlalchemy.engine")
+    sql_logger.setLevel(logging.INFO)
+    sql_logger.propagate = False
+    for handler in logging.getLogger(LOGGER_NAME).handlers:
+        if handler not in sql_logger.handlers:
+            sql_logger.addHandler(handler)
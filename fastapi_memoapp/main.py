@@ -1,26 +1,96 @@
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
+from logger import setup_logging, get_logger, enable_sql_logging
 from routers.memo import router as memo_router
+from timing import RequestContextMiddleware, instrument_engine
+from write_queue import memo_writer
+from maintenance import maintenance_task
+from schema import ensure_schema
+from warmup import open_pool, warm_queries
+import db
 
-app = FastAPI()
+app_logger = setup_logging()
+# SQLのログは出力しない場合にコストがかからないよう、必要なときだけロガーを有効にする
+if db.settings.echo or app_logger.isEnabledFor(logging.DEBUG):
+    enable_sql_logging()
+instrument_engine(db.engine)
+instrument_engine(db.read_engine)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://127.0.0.1:5500"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+logger = get_logger("startup")
 
-app.include_router(memo_router)
+# 0の場合は接続とクエリの事前準備を省略する(開発時の再起動を速くしたい場合など)
+WARMUP = os.getenv("MEMOAPP_WARMUP", "1").lower() in ("1", "true", "yes", "on")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """スキーマの検証と接続・キャッシュの準備を終えてからリクエストを受け付ける"""
+    timings: dict[str, float] = {}
+    started = phase_started = time.perf_counter()
+
+    def finish_phase(name: str) -> None:
+        nonlocal phase_started
+        now = time.perf_counter()
+        timings[f"{name}_ms"] = round((now - phase_started) * 1000, 2)
+        phase_started = now
+
+    await ensure_schema(db.engine)
+    finish_phase("schema")
+    if WARMUP:
+        await open_pool(db.engine, 1)
+        await open_pool(db.read_engine, db.settings.read_pool_size)
+        finish_phase("pool")
+        await warm_queries(db.async_read_session)
+        finish_phase("queries")
+    if memo_writer.enabled:
+        memo_writer.start()
+    maintenance_task.start()
+    finish_phase("tasks")
+    timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    app.state.startup_timings = timings
+    logger.info("起動準備完了", extra=timings)
+
+    yield
+
+    await maintenance_task.stop()
+    # キューに残っている登録をCOMMITしてから終了する
+    await memo_writer.stop()
+    await db.engine.dispose()
+    await db.read_engine.dispose()
 
-@app.exception_handler(ValidationError)
 async def validation_exception_handler(exc: ValidationError):
     return JSONResponse(
         status_code=422,
         content={
             "detail": exc.errors()
         }
-    )
\ No newline at end of file
+    )
+
+def create_app() -> FastAPI:
+    """
+        アプリケーションを組み立てる関数
+        uvicorn main:app のほか、uvicorn main:create_app --factory でも起動できる
+    """
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://127.0.0.1:5500"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # 最も外側で計測するため、最後に追加する
+    app.add_middleware(RequestContextMiddleware)
+
+    app.include_router(memo_router)
+    app.add_exception_handler(ValidationError, validation_exception_handler)
+    return app
+
+app = create_app()
@@ -0,0 +1,147 @@
+"""
+論理削除したメモの物理削除とデータベースファイルの圧縮
+
+メモの削除はdeleted_atを設定するだけなので、保持期間を過ぎた行を
+バックグラウンドタスクが小分けに物理削除し、incremental_vacuumで空き領域をOSに返却する。
+書き込み用エンジンは接続が1本のため、バッチごとにトランザクションを分けて他の書き込みを待たせすぎないようにする。
+
+    MEMOAPP_MAINTENANCE             : 0で無効にする(既定: 有効)
+    MEMOAPP_MAINTENANCE_WINDOW      : 実行してよい時間帯(ローカル時刻の時、開始-終了。既定: 2-5)
+    MEMOAPP_MAINTENANCE_INTERVAL_S  : 実行を試みる間隔(秒。既定: 600)
+    MEMOAPP_TOMBSTONE_RETENTION_S   : 論理削除した行を残しておく期間(秒。既定: 86400)
+
+incremental_vacuumはauto_vacuum=INCREMENTALのデータベースでだけ効く。
+それ以前に作成したデータベースは、一度 `PRAGMA auto_vacuum=INCREMENTAL; VACUUM;` を実行して変換する。
+"""
+import asyncio
+import contextvars
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+import db
+import models.memo as memo_model
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# PRAGMA auto_vacuum の値。2がINCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+async def purge_tombstones(
+    session_factory: async_sessionmaker,
+    older_than: datetime,
+    batch_size: int = 500,
+    pause: float = 0.05) -> int:
+    """
+        older_thanより前に論理削除したメモを batch_size 件ずつ物理削除する関数
+        Args:
+            session_factory(async_sessionmaker): 書き込み用セッションの生成元
+            older_than(datetime): この日時より前に論理削除した行を対象にする
+            batch_size(int): 1トランザクションで削除する件数
+            pause(float): バッチの間に他の書き込みへ譲る時間(秒)
+        Returns:
+            int: 物理削除した件数
+    """
+    Memo = memo_model.Memo
+    purged = 0
+    while True:
+        async with session_factory() as session:
+            result = await session.execute(
+                delete(Memo)
+                .where(Memo.memo_id.in_(
+                    select(Memo.memo_id)
+                    .where(Memo.deleted_at < older_than)
+                    .limit(batch_size)
+                    .scalar_subquery()
+                ))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        purged += result.rowcount
+        if result.rowcount < batch_size:
+            return purged
+        await asyncio.sleep(pause)
+
+async def compact(engine: AsyncEngine, max_pages: int = 2000) -> None:
+    """
+        空きページをOSに返却し、クエリプランナーの統計を更新する関数
+        Args:
+            engine(AsyncEngine): 書き込み用エンジン
+            max_pages(int): 1回のincremental_vacuumで返却する最大ページ数
+    """
+    async with engine.connect() as conn:
+        auto_vacuum = (await conn.execute(text("PRAGMA auto_vacuum"))).scalar()
+        if auto_vacuum == AUTO_VACUUM_INCREMENTAL:
+            # sqlite3モジュールのexecuteは結果列のない文を1ステップしか進めず1ページしか返却しないため、
+            # 最後まで実行するexecutescriptをドライバーの接続で直接呼ぶ
+            raw_connection = await conn.get_raw_connection()
+            await raw_connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({int(max_pages)});"
+            )
+        else:
+            logger.info("auto_vacuumがINCREMENTALではないため、incremental_vacuumを省略します")
+        await conn.execute(text("PRAGMA optimize"))
+        await conn.commit()
+
+def _parse_window(value: str) -> tuple[int, int]:
+    start, _, end = value.partition("-")
+    return int(start), int(end)
+
+class MaintenanceTask:
+    """指定した時間帯に、定期的に物理削除と圧縮を行うバックグラウンドタスク"""
+
+    def __init__(self, enabled: bool, window: tuple[int, int], interval: float, retention: timedelta):
+        self.enabled = enabled
+        self.window = window
+        self.interval = interval
+        self.retention = retention
+        self._task: asyncio.Task | None = None
+
+    def in_window(self, now: datetime) -> bool:
+        start, end = self.window
+        if start <= end:
+            return start <= now.hour < end
+        # 22-4 のように日付をまたぐ時間帯
+        return now.hour >= start or now.hour < end
+
+    async def run_once(self) -> int:
+        """物理削除と圧縮を1回実行し、物理削除した件数を返す"""
+        purged = await purge_tombstones(db.async_session, datetime.now() - self.retention)
+        await compact(db.engine)
+        logger.info("メンテナンス完了", extra={"purged": purged})
+        return purged
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.in_window(datetime.now()):
+                continue
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("メンテナンス処理でエラーが発生")
+
+    def start(self) -> None:
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(), name="memo-maintenance", context=contextvars.Context()
+        )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+maintenance_task = MaintenanceTask(
+    enabled=os.getenv("MEMOAPP_MAINTENANCE", "1").lower() in ("1", "true", "yes", "on"),
+    window=_parse_window(os.getenv("MEMOAPP_MAINTENANCE_WINDOW", "2-5")),
+    interval=float(os.getenv("MEMOAPP_MAINTENANCE_INTERVAL_S", "600")),
+    retention=timedelta(seconds=float(os.getenv("MEMOAPP_TOMBSTONE_RETENTION_S", "86400"))),
+)
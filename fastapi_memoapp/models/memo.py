@@ -1,12 +1,37 @@
 from typing import Optional
 from pickle import TRUE
-from sqlalchemy import Column, Integer, String, DateTime, func, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, func, Boolean, Index, DDL, event, table, column, text
 from db import Base
 from datetime import datetime
 from sqlalchemy.orm import Mapped, mapped_column
 
 class Memo(Base):
     __tablename__ = "memos"
+    # 一覧APIの絞り込み・並び替えに対応する複合インデックス
+    # (memo_idはrowidの別名なので、各インデックスの末尾に暗黙的に含まれる)
+    # 読み取りは常に削除済みの行を除くため、未削除の行だけを対象にした部分インデックスにする
+    __table_args__ = (
+        Index("ix_memos_completed_priority_due", "is_completed", "priority", "due_date",
+              sqlite_where=text("deleted_at IS NULL")),
+        Index("ix_memos_completed_due", "is_completed", "due_date",
+              sqlite_where=text("deleted_at IS NULL")),
+        Index("ix_memos_priority_due", "priority", "due_date",
+              sqlite_where=text("deleted_at IS NULL")),
+        Index("ix_memos_due_date", "due_date",
+              sqlite_where=text("deleted_at IS NULL")),
+        # sort=priority のキーセットページネーション用((priority, memo_id) の順に並ぶ)
+        Index("ix_memos_priority", "priority",
+              sqlite_where=text("deleted_at IS NULL")),
+        # is_completed(とpriority)で絞り込んだ既定のmemo_id順の一覧用。
+        # 末尾のmemo_idの順に並ぶため、afterのカーソルから範囲検索できる
+        Index("ix_memos_completed", "is_completed",
+              sqlite_where=text("deleted_at IS NULL")),
+        Index("ix_memos_completed_priority", "is_completed", "priority",
+              sqlite_where=text("deleted_at IS NULL")),
+        # 削除済みの行を物理削除するメンテナンス処理用
+        Index("ix_memos_deleted_at", "deleted_at",
+              sqlite_where=text("deleted_at IS NOT NULL")),
+    )
     memo_id:Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     title: Mapped[str] = mapped_column(String(50), nullable=False)
     description: Mapped[str] = mapped_column(String(255), nullable=True)
@@ -14,4 +39,108 @@ class Memo(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
     priority: Mapped[str] = mapped_column(String(10), nullable=False)
     due_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
-    is_completed: Mapped[bool] = mapped_column(Boolean, default=False)
\ No newline at end of file
+    is_completed: Mapped[bool] = mapped_column(Boolean, default=False)
+    # 論理削除した日時。NULLの行だけが有効なメモとして扱われる
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+# タイトルと詳細の全文検索用インデックス(FTS5)。
+# 日本語は単語の区切りがないため、3文字単位で索引化するtrigramトークナイザーを使う。
+# 外部コンテンツ方式でmemosテーブルを参照し、トリガーで同期する
+memos_fts = table("memos_fts", column("rowid"), column("rank"))
+
+MEMO_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS memos_fts USING fts5(
+        title, description, content='memos', content_rowid='memo_id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_fts_ai AFTER INSERT ON memos BEGIN
+        INSERT INTO memos_fts(rowid, title, description)
+        VALUES (new.memo_id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_fts_ad AFTER DELETE ON memos BEGIN
+        INSERT INTO memos_fts(memos_fts, rowid, title, description)
+        VALUES ('delete', old.memo_id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_fts_au AFTER UPDATE OF title, description ON memos BEGIN
+        INSERT INTO memos_fts(memos_fts, rowid, title, description)
+        VALUES ('delete', old.memo_id, old.title, old.description);
+        INSERT INTO memos_fts(rowid, title, description)
+        VALUES (new.memo_id, new.title, new.description);
+    END
+    """,
+    # 既存の行を索引に取り込む(新規作成したテーブルでは何もしない)
+    "INSERT INTO memos_fts(memos_fts) VALUES ('rebuild')",
+]
+
+for statement in MEMO_FTS_DDL:
+    event.listen(Memo.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+# トリガーはmemosと一緒に消えるが、仮想テーブルは残るため明示的に削除する
+event.listen(Memo.__table__, "before_drop",
+             DDL("DROP TABLE IF EXISTS memos_fts").execute_if(dialect="sqlite"))
+
+
+class MemoStat(Base):
+    """
+        メモの件数の集計テーブル。memosへの書き込み時にトリガーで増減させる
+        key: 'total' / 'open' / 'completed' / 'priority:<優先度>'
+    """
+    __tablename__ = "memo_stats"
+    key: Mapped[str] = mapped_column(String(40), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+# 1行分の集計キーと増減値を、論理削除されていない行の場合だけ返すSELECT句を組み立てる
+def _memo_stat_rows(row: str, sign: str) -> str:
+    return (
+        f"SELECT column1, column2 FROM (VALUES "
+        f"('total', {sign}1), "
+        f"('priority:' || {row}.priority, {sign}1), "
+        f"(CASE WHEN {row}.is_completed THEN 'completed' ELSE 'open' END, {sign}1)"
+        f") WHERE {row}.deleted_at IS NULL"
+    )
+
+_UPSERT_STATS = "INSERT INTO memo_stats(key, count) {rows} " \
+                "ON CONFLICT(key) DO UPDATE SET count = count + excluded.count;"
+
+MEMO_STATS_DDL = [
+    # 定義を変更した場合にも既存のデータベースへ反映されるよう、毎回作り直す
+    "DROP TRIGGER IF EXISTS memo_stats_ai",
+    "DROP TRIGGER IF EXISTS memo_stats_ad",
+    "DROP TRIGGER IF EXISTS memo_stats_au",
+    f"""
+    CREATE TRIGGER memo_stats_ai AFTER INSERT ON memos BEGIN
+        {_UPSERT_STATS.format(rows=_memo_stat_rows("new", ""))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER memo_stats_ad AFTER DELETE ON memos BEGIN
+        {_UPSERT_STATS.format(rows=_memo_stat_rows("old", "-"))}
+    END
+    """,
+    # 論理削除(deleted_atの設定)は集計から外す操作として扱う
+    f"""
+    CREATE TRIGGER memo_stats_au AFTER UPDATE OF priority, is_completed, deleted_at ON memos BEGIN
+        {_UPSERT_STATS.format(rows=_memo_stat_rows("old", "-"))}
+        {_UPSERT_STATS.format(rows=_memo_stat_rows("new", ""))}
+    END
+    """,
+    # トリガー作成前から存在する行を反映するため、集計をmemosから作り直す
+    "DELETE FROM memo_stats",
+    """
+    INSERT INTO memo_stats(key, count)
+    SELECT 'total', count(*) FROM memos WHERE deleted_at IS NULL
+    UNION ALL SELECT 'priority:' || priority, count(*) FROM memos
+              WHERE deleted_at IS NULL GROUP BY priority
+    UNION ALL SELECT CASE WHEN is_completed THEN 'completed' ELSE 'open' END, count(*)
+              FROM memos WHERE deleted_at IS NULL GROUP BY is_completed
+    """,
+]
+
+# memosとmemo_statsの両方が揃ってから作成するため、テーブル単位ではなくメタデータ全体の作成後に実行する
+for statement in MEMO_STATS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
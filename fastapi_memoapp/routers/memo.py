@@ -1,38 +1,273 @@
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+import io
+import tempfile
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Body, Header, WebSocket
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from schemas.memo import UpsertMemoSchema, MemoSchema, ResponseSchema, MemoStatusSchema
+from schemas.memo import (UpsertMemoSchema, MemoSchema, ResponseSchema, MemoStatusSchema,
+                          BulkDeleteSchema, BulkResultSchema, MemoFilterSchema, MemoStatsSchema,
+                          ImportReportSchema, PatchMemoSchema)
 import cruds.memo as memo_crud
+import admission
+from cache import memo_cache
+from changefeed import change_feed, Subscription
+import encoding
+import exporter
+import importer
 import db
+from logger import get_logger
+from timing import TimedRoute
+from write_queue import memo_writer, get_insert_session
 
-router = APIRouter(tags=["Memos"], prefix="/memos")
+logger = get_logger(__name__)
+
+router = APIRouter(tags=["Memos"], prefix="/memos", route_class=TimedRoute)
+
+# 一括エンドポイントで1リクエストに含められる最大件数
+BULK_MAX_ITEMS = 1000
+
+# 取り込みファイルをメモリに保持する上限。超えた分は一時ファイルに書き出す
+IMPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Content-Typeから取り込み形式を判定するための対応表
+IMPORT_CONTENT_TYPES: dict[str, importer.ImportFormat] = {
+    "text/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json-lines": "jsonl",
+}
+
+# SSEの接続が切れたときにブラウザが再接続するまでの待ち時間
+SSE_RETRY_MS = 3000
 
 @router.post("/", response_model=ResponseSchema)
-async def create_memo(memo: UpsertMemoSchema, db: AsyncSession = Depends(db.get_dbsession)):
+async def create_memo(memo: UpsertMemoSchema, db: AsyncSession = Depends(get_insert_session)):
     try:
         await memo_crud.insert_memo(db, memo)
         return ResponseSchema(message="メモが正常に登録されました")
+    except admission.Overloaded as e:
+        logger.debug("リクエストを受け付けられません: %s", e)
+        raise admission.service_unavailable()
     except Exception as e:
-        print(f"ルーターでエラーが発生: {e}")
+        logger.warning("ルーターでエラーが発生: %s", e)
         raise HTTPException(status_code=400, detail=f"メモの登録に失敗しました: {str(e)}")
 
-@router.get("/", response_model=list[MemoSchema])
-async def get_memos_list(db: AsyncSession = Depends(db.get_dbsession)):
-    memos = await memo_crud.get_memos(db)
-    # データベースのモデルをスキーマに変換
-    memo_schemas = []
-    for memo in memos:
-        memo_schema = MemoSchema(
-            memo_id=memo.memo_id,
-            title=memo.title,
-            description=memo.description,
-            status=MemoStatusSchema(
-                priority=memo.priority,
-                due_date=memo.due_date,
-                is_completed=memo.is_completed
-            )
+def _to_memo_schema(memo) -> MemoSchema:
+    """データベースのモデルをレスポンス用のスキーマに変換する"""
+    return MemoSchema(
+        memo_id=memo.memo_id,
+        title=memo.title,
+        description=memo.description,
+        status=MemoStatusSchema(
+            priority=memo.priority,
+            due_date=memo.due_date,
+            is_completed=memo.is_completed
         )
-        memo_schemas.append(memo_schema)
-    return memo_schemas
+    )
+
+async def _stream_memo_chunks(queries) -> AsyncIterator[list[dict]]:
+    """メモをチャンク単位で読み出す(テーブル全体をメモリに載せない)"""
+    # レスポンス送信中もセッションが生きているよう、ストリーム専用のセッションを開く
+    async with db.async_read_session() as session:
+        async for rows in memo_crud.stream_memo_rows(session, queries):
+            yield rows
+
+@router.get("/", response_model=list[MemoSchema],
+            responses={200: {"content": {encoding.MEDIA_TYPES["ndjson"]: {}}}})
+async def get_memos_list(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000, description="1ページあたりの最大件数"),
+    after: int | None = Query(None, ge=0, description="前ページ最後のmemo_id。このIDより後ろのメモを返す"),
+    stream: bool = Query(False, description="trueの場合、after以降の全件をチャンク形式のJSONで逐次返す"),
+    priority: str | None = Query(None, description="指定した優先度のメモに絞り込む"),
+    is_completed: bool | None = Query(None, description="完了状態で絞り込む"),
+    due_from: datetime | None = Query(None, description="期限日がこの日時以降のメモに絞り込む"),
+    due_to: datetime | None = Query(None, description="期限日がこの日時より前のメモに絞り込む"),
+    sort: Literal["memo_id", "due_date", "priority"] = Query("memo_id", description="並び替えに使う項目"),
+    order: Literal["asc", "desc"] = Query("asc", description="並び順"),
+    db: AsyncSession = Depends(db.get_dbsession)):
+    filters = MemoFilterSchema(priority=priority, is_completed=is_completed,
+                               due_from=due_from, due_to=due_to, sort=sort, order=order)
+    try:
+        if stream:
+            queries = await memo_crud.build_memos_queries(db, filters, after)
+            # 依存関係のセッションはレスポンスの送信後まで閉じられないため、カーソルを解決したら
+            # ここで接続をプールに返す(ストリームは専用のセッションで読み出す)
+            await db.close()
+            return encoding.streaming_list_response(request, _stream_memo_chunks(queries))
+        rows = await memo_crud.get_memo_rows(db, filters, limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {}
+    # 続きがある場合は次ページのカーソルをヘッダーで返す
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = str(rows[-1]["memo_id"])
+    # 自前のDBから読んだ値なのでresponse_modelによる再検証を省き、pydantic-coreで直接エンコードする
+    # (Acceptに応じてJSON配列かNDJSON、Accept-Encodingに応じてgzip)
+    return encoding.list_response(request, rows, headers=headers)
+
+# /memos/bulk は /memos/{memo_id} より先に登録しないとパスパラメータとして解釈される
+@router.post("/bulk", response_model=list[BulkResultSchema])
+async def create_memos_bulk(
+    memos: list[UpsertMemoSchema] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(db.get_dbsession)):
+    try:
+        memo_ids = await memo_crud.insert_memos(db, memos)
+    except Exception as e:
+        logger.warning("ルーターでエラーが発生: %s", e)
+        raise HTTPException(status_code=400, detail=f"メモの一括登録に失敗しました: {str(e)}")
+    return [BulkResultSchema(memo_id=memo_id, success=True, detail="登録しました")
+            for memo_id in memo_ids]
+
+@router.put("/bulk", response_model=list[BulkResultSchema])
+async def modify_memos_bulk(
+    memos: list[MemoSchema] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(db.get_dbsession)):
+    try:
+        updated_ids = await memo_crud.update_memos(db, memos)
+    except Exception as e:
+        logger.warning("ルーターでエラーが発生: %s", e)
+        raise HTTPException(status_code=400, detail=f"メモの一括更新に失敗しました: {str(e)}")
+    return [BulkResultSchema(memo_id=memo.memo_id, success=True, detail="更新しました")
+            if memo.memo_id in updated_ids else
+            BulkResultSchema(memo_id=memo.memo_id, success=False, detail="更新対象が見つかりません")
+            for memo in memos]
+
+@router.delete("/bulk", response_model=list[BulkResultSchema])
+async def delete_memos_bulk(target: BulkDeleteSchema, db: AsyncSession = Depends(db.get_dbsession)):
+    try:
+        deleted_ids = await memo_crud.delete_memos(db, target.memo_ids)
+    except Exception as e:
+        logger.warning("ルーターでエラーが発生: %s", e)
+        raise HTTPException(status_code=400, detail=f"メモの一括削除に失敗しました: {str(e)}")
+    return [BulkResultSchema(memo_id=memo_id, success=True, detail="削除しました")
+            if memo_id in deleted_ids else
+            BulkResultSchema(memo_id=memo_id, success=False, detail="削除対象が見つかりません")
+            for memo_id in target.memo_ids]
+
+async def _stream_changes(subscription: Subscription) -> AsyncIterator[bytes]:
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        async for event in subscription.events(change_feed.heartbeat):
+            if event is None:
+                # 途中のプロキシに無通信の接続を切られないよう、コメント行を送る
+                yield b": keepalive\n\n"
+            else:
+                yield b"id: " + event.id.encode() + b"\ndata: " + event.to_json() + b"\n\n"
+    finally:
+        change_feed.unsubscribe(subscription)
+
+@router.get("/changes", response_class=StreamingResponse)
+async def stream_changes(
+    last_event_id: str | None = Header(None, description="最後に受け取ったイベントのID。再接続時にブラウザが自動で送る"),
+    after: str | None = Query(None, description="最後に受け取ったイベントのID。Last-Event-IDヘッダーより優先する")):
+    subscription = change_feed.subscribe(after or last_event_id)
+    return StreamingResponse(
+        _stream_changes(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _send_changes(websocket: WebSocket, subscription: Subscription) -> None:
+    async for event in subscription.events(change_feed.heartbeat):
+        if event is None:
+            await websocket.send_text('{"type":"heartbeat"}')
+        else:
+            await websocket.send_text(event.to_json().decode())
+    # 配信が追いつかず切り離された。resetイベントを受けたクライアントは一覧を取得し直して再接続する
+    await websocket.close(code=1013)
+
+async def _wait_disconnect(websocket: WebSocket) -> None:
+    # クライアントからのメッセージは使わないが、切断をすぐ検知するために受信し続ける
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+@router.websocket("/changes/ws")
+async def changes_websocket(
+    websocket: WebSocket,
+    after: str | None = Query(None, description="最後に受け取ったイベントのID")):
+    await websocket.accept()
+    subscription = change_feed.subscribe(after)
+    sender = asyncio.create_task(_send_changes(websocket, subscription))
+    receiver = asyncio.create_task(_wait_disconnect(websocket))
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        change_feed.unsubscribe(subscription)
+        sender.cancel()
+        receiver.cancel()
+        # 切断による送信エラーはここで回収して捨てる
+        await asyncio.gather(sender, receiver, return_exceptions=True)
+
+@router.get("/changes/stats", response_model=dict[str, int])
+async def get_changes_stats():
+    return change_feed.stats()
+
+@router.get("/admission/stats", response_model=dict[str, dict[str, int | float]])
+async def get_admission_stats():
+    # 読み取り・書き込みごとの処理中・待ち行列の件数と、断った回数を返す
+    # (グループコミットの登録は書き込みの処理枠を使わないため、書き込みキューの値も併せて返す)
+    return {**admission.stats(), "group_commit": memo_writer.stats()}
+
+@router.get("/cache/stats", response_model=dict[str, dict[str, int]])
+async def get_cache_stats():
+    # キャッシュサイズ調整用にヒット・ミス・追い出しの回数を返す
+    return memo_cache.stats()
+
+@router.post("/import", response_model=ImportReportSchema)
+async def import_memos_file(
+    request: Request,
+    format: importer.ImportFormat | None = Query(None, description="ファイル形式。省略時はContent-Typeから判定する"),
+    db: AsyncSession = Depends(db.get_dbsession)):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    import_format = format or IMPORT_CONTENT_TYPES.get(content_type)
+    if import_format is None:
+        raise HTTPException(status_code=415, detail="text/csv または application/x-ndjson で送信してください")
+    # リクエスト本文を受け取りながら一時ファイルへ書き出し、本文全体をメモリに載せない
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_SIZE) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        try:
+            report = await importer.import_memos(db, text, import_format)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="UTF-8として読み取れないファイルです")
+        finally:
+            text.detach()
+    return ImportReportSchema(inserted=report.inserted, rejected=report.rejected, errors=report.errors)
+
+@router.get("/export", response_class=StreamingResponse, dependencies=[Depends(admission.read_slot)])
+async def export_memos(
+    format: exporter.ExportFormat = Query("parquet", description="出力形式。parquet または arrow(Arrow IPCストリーム)")):
+    return StreamingResponse(
+        exporter.iter_export(db.async_read_session, format),
+        media_type=exporter.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="memos.{exporter.FILE_EXTENSIONS[format]}"'},
+    )
+
+@router.get("/stats", response_model=MemoStatsSchema)
+async def get_memo_stats(db: AsyncSession = Depends(db.get_dbsession)):
+    return await memo_crud.get_memo_stats(db)
+
+@router.get("/search", response_model=list[MemoSchema])
+async def search_memos(
+    q: str = Query(..., min_length=1, description="検索語。空白で区切ると全ての語を含むメモを返す"),
+    limit: int = Query(20, ge=1, le=100, description="1ページあたりの最大件数"),
+    offset: int = Query(0, ge=0, description="読み飛ばす件数"),
+    db: AsyncSession = Depends(db.get_dbsession)):
+    memos = await memo_crud.search_memos(db, q, limit=limit, offset=offset)
+    return [_to_memo_schema(memo) for memo in memos]
+
+@router.get("/{memo_id}", response_model=MemoSchema)
+async def get_memo_detail(memo_id: int, db: AsyncSession = Depends(db.get_dbsession)):
+    memo = await memo_crud.get_memo_by_id(db, memo_id)
+    if not memo:
+        raise HTTPException(status_code=404, detail="メモが見つかりません")
+    return _to_memo_schema(memo)
 
 @router.put("/{memo_id}", response_model=ResponseSchema)
 async def modify_memo(memo_id: int, memo: UpsertMemoSchema, db: AsyncSession = Depends(db.get_dbsession)):
@@ -41,6 +276,23 @@ async def modify_memo(memo_id: int, memo: UpsertMemoSchema, db: AsyncSession = D
         raise HTTPException(status_code=404, detail="更新対象が見つかりません")
     return ResponseSchema(message="メモが正常に更新されました")
 
+@router.patch("/{memo_id}", response_model=ResponseSchema)
+async def patch_memo(memo_id: int, memo: PatchMemoSchema, read_db: AsyncSession = Depends(db.get_read_dbsession)):
+    # 値が変わるかを読み取り用のセッションで判定し、変わる場合だけ書き込みの処理枠と接続を使う
+    changes = await memo_crud.get_patch_changes(read_db, memo_id, memo)
+    if changes is None:
+        raise HTTPException(status_code=404, detail="更新対象が見つかりません")
+    if not changes:
+        return ResponseSchema(message="変更はありませんでした")
+    await read_db.close()
+    async with db.write_session() as session:
+        updated = await memo_crud.patch_memo(session, memo_id, changes)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="更新対象が見つかりません")
+    if not updated:
+        return ResponseSchema(message="変更はありませんでした")
+    return ResponseSchema(message="メモが正常に更新されました")
+
 @router.delete("/{memo_id}", response_model=ResponseSchema)
 async def delete_memo(memo_id: int, db: AsyncSession = Depends(db.get_dbsession)):
     result = await memo_crud.delete_memo(db, memo_id)
@@ -0,0 +1,135 @@
+"""
+データベーススキーマの検証と作成
+
+起動時に models の定義と実際のデータベースを突き合わせ、足りないものを作成する。
+既存の行を残したまま反映できる変更(テーブル・NULL許容のカラム・インデックス・
+全文検索の索引・集計トリガーの追加や作り直し)だけを行い、それ以外は SchemaError とする。
+
+    MEMOAPP_SCHEMA_MODE : create で不足分を作成する(既定)、check で検証だけを行い不足があれば起動を中止する
+"""
+import os
+import re
+from typing import Literal
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateColumn, CreateIndex
+import db
+import models.memo as memo_model
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+SchemaMode = Literal["create", "check"]
+
+SCHEMA_MODE: SchemaMode = os.getenv("MEMOAPP_SCHEMA_MODE", "create")
+
+class SchemaError(RuntimeError):
+    """データベースのスキーマがモデルの定義と一致せず、起動を続けられない場合の例外"""
+
+def _normalize(sql: str) -> str:
+    # sqlite_masterにはIF NOT EXISTSを除いた作成時のSQLが保存されるため、空白と合わせて揃えてから比較する
+    return " ".join(sql.replace("IF NOT EXISTS ", "").split())
+
+def _triggers(statements: list[str]) -> dict[str, str]:
+    """DDLのリストからトリガー名と作成SQLの対応を取り出す"""
+    triggers = {}
+    for statement in statements:
+        match = re.match(r"\s*CREATE TRIGGER (?:IF NOT EXISTS )?(\w+)", statement)
+        if match:
+            triggers[match.group(1)] = _normalize(statement)
+    return triggers
+
+def _plan(conn: Connection) -> tuple[list[tuple[str, str]], list[str]]:
+    """
+        モデルの定義と実際のスキーマの差分を調べる
+        Returns:
+            tuple: (実行するSQLと説明の組のリスト, 自動では反映できない差分の説明のリスト)
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    master = {
+        name: _normalize(sql or "")
+        for name, sql in conn.execute(text("SELECT name, sql FROM sqlite_master"))
+    }
+    steps: list[tuple[str, str]] = []
+    problems: list[str] = []
+
+    if not existing_tables & set(db.Base.metadata.tables):
+        # 空のデータベース。create_allでトリガーや索引も含めて作成する
+        return [("create_all", "全テーブルを作成")], []
+
+    for table in db.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            steps.append(("create_all", f"テーブル {table.name} を作成"))
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                problems.append(f"{table.name}.{column.name} はNOT NULLのため既存の行に追加できません")
+                continue
+            ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            steps.append((f"ALTER TABLE {table.name} ADD COLUMN {ddl}",
+                          f"カラム {table.name}.{column.name} を追加"))
+        for index in table.indexes:
+            expected = _normalize(str(CreateIndex(index).compile(dialect=conn.dialect)))
+            if index.name in master and master[index.name] != expected:
+                steps.append((f"DROP INDEX {index.name}", f"定義が異なるインデックス {index.name} を削除"))
+            if master.get(index.name) != expected:
+                steps.append((expected, f"インデックス {index.name} を作成"))
+
+    if "memos_fts" not in master or any(
+            master.get(name) != sql for name, sql in _triggers(memo_model.MEMO_FTS_DDL).items()):
+        for name in _triggers(memo_model.MEMO_FTS_DDL):
+            steps.append((f"DROP TRIGGER IF EXISTS {name}", f"全文検索のトリガー {name} を作り直す"))
+        steps.extend((statement, "全文検索の索引を作成・再構築") for statement in memo_model.MEMO_FTS_DDL)
+
+    if any(master.get(name) != sql for name, sql in _triggers(memo_model.MEMO_STATS_DDL).items()):
+        steps.extend((statement, "集計トリガーを作り直し、集計を再構築") for statement in memo_model.MEMO_STATS_DDL)
+    return steps, problems
+
+def _apply(conn: Connection, mode: SchemaMode) -> list[str]:
+    steps, problems = _plan(conn)
+    if problems:
+        raise SchemaError(
+            "データベースのスキーマを自動で更新できません: " + "; ".join(problems)
+            + "。python init_database.py でデータベースを作り直してください"
+        )
+    descriptions = list(dict.fromkeys(description for _, description in steps))
+    if mode == "check":
+        if steps:
+            raise SchemaError(
+                "データベースのスキーマが古いため起動を中止します: " + "; ".join(descriptions)
+                + "。MEMOAPP_SCHEMA_MODE=create で起動するか python create_tables.py を実行してください"
+            )
+        return []
+    if any(statement == "create_all" for statement, _ in steps):
+        # 集計の再構築が新しいカラムを参照するため、カラムを先に追加してから
+        # 不足しているテーブルとそのインデックス・トリガーを作成する
+        for statement, _ in steps:
+            if statement.startswith("ALTER TABLE"):
+                conn.execute(text(statement))
+        db.Base.metadata.create_all(conn)
+        steps, _ = _plan(conn)
+    for statement, _ in steps:
+        conn.execute(text(statement))
+    return descriptions
+
+async def ensure_schema(engine: AsyncEngine, mode: SchemaMode = SCHEMA_MODE) -> list[str]:
+    """
+        データベースのスキーマを検証し、modeがcreateの場合は不足分を作成する関数
+        Args:
+            engine(AsyncEngine): 書き込み用エンジン
+            mode(SchemaMode): create(不足分を作成する) または check(検証だけを行う)
+        Returns:
+            list[str]: 行った変更の説明。変更がなかった場合は空のリスト
+        Raises:
+            SchemaError: スキーマが定義と一致せず、modeの範囲で解消できない場合
+    """
+    async with engine.begin() as conn:
+        changes = await conn.run_sync(_apply, mode)
+    for change in changes:
+        logger.info("スキーマを更新: %s", change)
+    return changes
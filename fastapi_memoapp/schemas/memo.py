@@ -1,5 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel, Field
+from typing import Literal
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 class MemoStatusSchema(BaseModel):
     priority: str = Field(..., description="優先度", examples=["高"])
@@ -31,4 +32,99 @@ class ResponseSchema(BaseModel):
     message: str = Field(...,
                          description="API操作の結果を説明するメッセージ。",
                          examples=["メモの更新に成功しました。"]
-                         )
\ No newline at end of file
+                         )
+
+class BulkDeleteSchema(BaseModel):
+    memo_ids: list[int] = Field(...,
+                                description="削除するメモのIDのリスト。",
+                                examples=[[1, 2, 3]],
+                                min_length=1,
+                                max_length=1000
+                                )
+
+class BulkResultSchema(BaseModel):
+    memo_id: int | None = Field(...,
+                                description="処理対象のメモのID。登録に失敗した場合はNone",
+                                examples=[123]
+                                )
+    success: bool = Field(..., description="処理が成功したかどうかを示すフラグ", examples=[True])
+    detail: str = Field(...,
+                        description="処理結果を説明するメッセージ。",
+                        examples=["更新しました"]
+                        )
+
+
+class MemoFilterSchema(BaseModel):
+    # キャッシュのキーとして使うため不変(ハッシュ可能)にする
+    model_config = ConfigDict(frozen=True)
+
+    priority: str | None = Field(None, description="指定した優先度のメモに絞り込む", examples=["高"])
+    is_completed: bool | None = Field(None, description="完了状態で絞り込む", examples=[False])
+    due_from: datetime | None = Field(None,
+                                      description="期限日がこの日時以降のメモに絞り込む",
+                                      examples=["2025-07-14T00:00:00"]
+                                      )
+    due_to: datetime | None = Field(None,
+                                    description="期限日がこの日時より前のメモに絞り込む",
+                                    examples=["2025-07-21T00:00:00"]
+                                    )
+    sort: Literal["memo_id", "due_date", "priority"] = Field("memo_id", description="並び替えに使う項目")
+    order: Literal["asc", "desc"] = Field("asc", description="並び順")
+
+
+class MemoStatsSchema(BaseModel):
+    total: int = Field(..., description="メモの総数", examples=[120])
+    open: int = Field(..., description="未完了のメモの数", examples=[80])
+    completed: int = Field(..., description="完了したメモの数", examples=[40])
+    overdue: int = Field(..., description="期限を過ぎた未完了のメモの数", examples=[5])
+    by_priority: dict[str, int] = Field(...,
+                                        description="優先度ごとのメモの数",
+                                        examples=[{"高": 30, "中": 50, "低": 40}]
+                                        )
+
+
+class ImportErrorSchema(BaseModel):
+    line: int = Field(..., description="不正だった行の行番号(1始まり)", examples=[12])
+    detail: str = Field(..., description="不正だった理由", examples=["title: String should have at least 1 character"])
+
+class ImportReportSchema(BaseModel):
+    inserted: int = Field(..., description="登録した件数", examples=[998])
+    rejected: int = Field(..., description="不正なためスキップした件数", examples=[2])
+    errors: list[ImportErrorSchema] = Field(..., description="スキップした行の詳細(先頭100件まで)")
+
+
+class PatchMemoStatusSchema(BaseModel):
+    priority: str | None = Field(None, description="優先度", examples=["高"])
+    due_date: datetime | None = Field(None,
+                                      description="メモの期限日。nullを指定すると期限を解除する",
+                                      examples=["2025-07-14T00:00:00"]
+                                      )
+    is_completed: bool | None = Field(None, description="メモが完了したかどうかを示すフラグ", examples=[True])
+
+    @model_validator(mode="after")
+    def reject_null_required(self):
+        # 期限日以外はNULLを許さないカラムのため、明示的なnullの指定は受け付けない
+        for name in ("priority", "is_completed"):
+            if name in self.model_fields_set and getattr(self, name) is None:
+                raise ValueError(f"{name}にnullは指定できません")
+        return self
+
+class PatchMemoSchema(BaseModel):
+    title: str | None = Field(None,
+                              description="メモのタイトル。指定した項目だけが更新されます。",
+                              examples=["明日のアジェンダ"],
+                              min_length=1
+                              )
+    description: str | None = Field(None,
+                                    description="メモの内容についての追加情報。",
+                                    examples=["会議で話すトピック：プロジェクトの進捗状況"]
+                                    )
+    status: PatchMemoStatusSchema | None = Field(None, description="更新するメモの状態")
+
+    @model_validator(mode="after")
+    def reject_null_required(self):
+        # descriptionはカラムとしてはNULLを許すが、レスポンス(MemoSchema)では文字列のため、PUTと同じく受け付けない
+        for name in ("title", "description", "status"):
+            if name in self.model_fields_set and getattr(self, name) is None:
+                raise ValueError(f"{name}にnullは指定できません")
+        return self
@@ -0,0 +1,154 @@
+"""
+リクエストIDの付与と処理時間の計測
+
+RequestContextMiddleware がリクエストごとに RequestTimings を用意し、
+TimedRoute とSQLAlchemyのイベントがそこへ各区間の時間を書き込む。
+集計結果はレスポンスの Server-Timing ヘッダーとして返す。
+
+    validation    : リクエストの解析・バリデーション・依存関係の解決
+    db            : SQLの実行
+    app           : エンドポイント関数のうちSQL実行以外
+    serialization : 戻り値の検証とJSONへの変換
+"""
+import functools
+import inspect
+import logging
+import os
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from logger import get_logger, request_id_var
+
+logger = get_logger("access")
+
+# この時間を超えたリクエストはWARNINGとして記録する
+SLOW_REQUEST_MS = float(os.getenv("MEMOAPP_SLOW_REQUEST_MS", "500"))
+
+@dataclass
+class RequestTimings:
+    """1リクエスト分の計測値(単位は秒、時刻はperf_counterの値)"""
+    started: float
+    handler_started: float | None = None
+    endpoint_started: float | None = None
+    endpoint_finished: float | None = None
+    handler_finished: float | None = None
+    db: float = 0.0
+
+    def server_timing(self, now: float) -> str:
+        metrics = []
+        if self.handler_started and self.endpoint_started:
+            metrics.append(("validation", self.endpoint_started - self.handler_started))
+        metrics.append(("db", self.db))
+        if self.endpoint_started and self.endpoint_finished:
+            metrics.append(("app", max(self.endpoint_finished - self.endpoint_started - self.db, 0.0)))
+        if self.endpoint_finished and self.handler_finished:
+            metrics.append(("serialization", self.handler_finished - self.endpoint_finished))
+        metrics.append(("total", now - self.started))
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in metrics)
+
+timings_var: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+class RequestContextMiddleware:
+    """リクエストIDを採番し、X-Request-ID と Server-Timing をレスポンスに付与するASGIミドルウェア"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        timings = RequestTimings(started=time.perf_counter())
+        status_code = 500
+
+        async def send_with_headers(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Request-ID", request_id)
+                headers.append("Server-Timing", timings.server_timing(time.perf_counter()))
+            await send(message)
+
+        request_id_token = request_id_var.set(request_id)
+        timings_token = timings_var.set(timings)
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            elapsed_ms = (time.perf_counter() - timings.started) * 1000
+            if elapsed_ms >= SLOW_REQUEST_MS:
+                logger.warning("slow request", extra={
+                    "method": scope["method"], "path": scope["path"],
+                    "status": status_code, "duration_ms": round(elapsed_ms, 2),
+                })
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.debug("request completed", extra={
+                    "method": scope["method"], "path": scope["path"],
+                    "status": status_code, "duration_ms": round(elapsed_ms, 2),
+                })
+            timings_var.reset(timings_token)
+            request_id_var.reset(request_id_token)
+
+def _timed_endpoint(endpoint):
+    """エンドポイント関数の開始・終了時刻を記録するラッパーを返す"""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        timings = timings_var.get()
+        if timings is None:
+            return await endpoint(*args, **kwargs)
+        timings.endpoint_started = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timings.endpoint_finished = time.perf_counter()
+    return wrapper
+
+class TimedRoute(APIRoute):
+    """バリデーション・エンドポイント・シリアライズの各区間を計測するルートクラス"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # 同期関数はスレッドプールで実行されるため、計測対象は非同期関数に限る
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = _timed_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timings = timings_var.get()
+            if timings is None:
+                return await handler(request)
+            timings.handler_started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                timings.handler_finished = time.perf_counter()
+        return timed_handler
+
+def instrument_engine(async_engine: AsyncEngine) -> None:
+    """SQLの実行時間を処理中リクエストの計測値に加算するイベントを登録する"""
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timings = timings_var.get()
+        started = conn.info.pop("query_started", None)
+        if timings is not None and started is not None:
+            timings.db += time.perf_counter() - started
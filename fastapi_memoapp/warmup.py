@@ -0,0 +1,42 @@
+"""
+起動直後の遅いリクエストをなくすための事前準備
+
+接続プールの接続を先に開いてPRAGMAの設定を済ませ、よく使う読み取りクエリを
+1度ずつ実行してSQLAlchemyのコンパイル済みSQLとメモのキャッシュを温める。
+"""
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+import cruds.memo as memo_crud
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+async def open_pool(engine: AsyncEngine, size: int) -> None:
+    """
+        接続プールの接続をsize本まで開いておく関数
+        Args:
+            engine(AsyncEngine): 対象のエンジン
+            size(int): 開いておく接続数。プールの上限を超えないこと
+    """
+    connections = []
+    try:
+        # 同時に保持しないとプールは同じ接続を使い回すため、全て開いてからまとめて返却する
+        for _ in range(size):
+            connection = await engine.connect()
+            connections.append(connection)
+            await connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in connections:
+            await connection.close()
+
+async def warm_queries(session_factory: async_sessionmaker) -> None:
+    """
+        一覧・集計・1件取得のクエリを実行し、コンパイル済みSQLとキャッシュを用意する関数
+        Args:
+            session_factory(async_sessionmaker): 読み取り用セッションの生成元
+    """
+    async with session_factory() as session:
+        # GET /memos/ の既定の条件と同じ先頭ページはキャッシュにも載る
+        await memo_crud.get_memo_rows(session)
+        await memo_crud.get_memo_stats(session)
+        # 存在しないIDはキャッシュに載らないため、SQLのコンパイルだけが行われる
+        await memo_crud.get_memo_by_id(session, 0)
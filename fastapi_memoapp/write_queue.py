@@ -0,0 +1,165 @@
+"""
+メモ登録のグループコミット
+
+有効にすると、insert_memo は1件ごとにトランザクションを張る代わりに行をキューへ積み、
+単一の書き込みタスクがまとめて1トランザクションでINSERTする。
+呼び出し元にはCOMMITが完了してから結果を返す。有効な場合は書き込み用の接続を
+synchronous=FULL にするため(db.load_settings)、COMMITのたびにfsyncし、応答済みの登録は
+電源断でも失われない。そのfsyncを複数の登録で1回にまとめることで、1件ごとのfsyncの待ちを減らす。
+MEMOAPP_DB_SYNCHRONOUS=NORMAL を指定した場合は、プロセスが落ちても残るが電源断では失われうる。
+
+    MEMOAPP_GROUP_COMMIT           : 1でグループコミットを有効にする(既定: 無効)
+    MEMOAPP_GROUP_COMMIT_MAX_BATCH : 1トランザクションにまとめる最大件数(既定: 256)
+    MEMOAPP_GROUP_COMMIT_LINGER_MS : 最初の1件が届いてから後続を待つ時間(既定: 2ミリ秒)
+    MEMOAPP_GROUP_COMMIT_MAX_QUEUE : COMMITを待てる件数の上限。超えた登録は 503 で断る(既定: 1024)
+
+グループコミットの登録はアドミッション制御の書き込みの処理枠を使わない。
+処理枠を確保したままCOMMITを待つと、1回にまとめられる件数が書き込みの同時実行数の上限で
+頭打ちになるため、代わりにこのキューの上限で受け付けを制限する。
+"""
+import asyncio
+import contextvars
+import os
+from fastapi import Request
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+import admission
+import db
+import models.memo as memo_model
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+class GroupCommitWriter:
+    """キューに積まれたメモを件数と待ち時間の上限でまとめて登録する書き込みタスク"""
+
+    def __init__(self, session_factory: async_sessionmaker, enabled: bool,
+                 max_batch: int = 256, linger_ms: float = 2.0, max_queue: int = 1024):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        # 登録を待っている件数(キューに積まれた行と、書き込み中のまとまりの行)
+        self.pending = 0
+        self.rejected = 0
+        self.linger = linger_ms / 1000
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """書き込みタスクを開始する。開始済みの場合は何もしない"""
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = asyncio.Queue()
+        # 最初に投入したリクエストのcontextvars(リクエストIDなど)を引き継がないよう空のコンテキストで動かす
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(), name="memo-group-commit", context=contextvars.Context()
+        )
+
+    async def stop(self) -> None:
+        """キューに残っている行を書き込んでから書き込みタスクを停止する"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, values: dict) -> memo_model.Memo:
+        """
+            1件のメモを登録キューに積み、COMMITされるまで待つ関数
+            Args:
+                values(dict): memosテーブルのカラム名をキーにした値
+            Returns:
+                Memo: 登録されたメモのモデル
+            Raises:
+                admission.Overloaded: COMMITを待っている件数が上限に達している場合
+        """
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise admission.Overloaded("group-commit: 登録待ちの件数が上限に達しています")
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.pending += 1
+        try:
+            await self._queue.put((values, future))
+            return await future
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "enabled": int(self.enabled),
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            # 同時に届いている後続の登録を少しだけ待って同じトランザクションにまとめる
+            if self._queue.qsize() < self.max_batch - 1 and self.linger > 0:
+                await asyncio.sleep(self.linger)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._commit(batch)
+            except Exception:
+                logger.exception("グループコミットの書き込みタスクでエラーが発生")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit(self, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        # 待っている呼び出し元がキャンセルされた行は書き込まない
+        batch = [(values, future) for values, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    insert(memo_model.Memo).returning(memo_model.Memo, sort_by_parameter_order=True),
+                    [values for values, _ in batch]
+                )
+                memos = list(result.scalars().all())
+                await session.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            # 1件の不正な行でまとめた全件を失敗させないよう、1件ずつ再実行して原因の行だけを失敗にする
+            logger.warning("グループコミットに失敗したため1件ずつ再実行します: %s", e)
+            for item in batch:
+                await self._commit([item])
+            return
+        logger.debug("グループコミット完了: %d件", len(memos))
+        for (_, future), memo in zip(batch, memos):
+            if not future.done():
+                future.set_result(memo)
+
+memo_writer = GroupCommitWriter(
+    db.async_session,
+    enabled=db.GROUP_COMMIT,
+    max_batch=int(os.getenv("MEMOAPP_GROUP_COMMIT_MAX_BATCH", "256")),
+    linger_ms=float(os.getenv("MEMOAPP_GROUP_COMMIT_LINGER_MS", "2")),
+    max_queue=int(os.getenv("MEMOAPP_GROUP_COMMIT_MAX_QUEUE", "1024")),
+)
+
+async def get_insert_session(request: Request):
+    """
+        POST /memos/ 用のセッションの依存関係
+        グループコミットが無効な場合は db.get_dbsession と同じく書き込みの処理枠を確保する。
+        有効な場合は書き込みキューの上限で受け付けを制限するため、処理枠を確保しない
+    """
+    if not memo_writer.enabled:
+        async with admission.admit(read_only=False):
+            async with db.async_session() as session:
+                yield session
+        return
+    async with db.async_session() as session:
+        yield session
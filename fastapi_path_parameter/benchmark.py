@@ -0,0 +1,74 @@
+"""
+ユーザー取得の計測(1件ずつのリクエストとまとめて取得するリクエストの比較)
+
+ユーザーの件数を増やした上で、
+    - idの索引による取得と、以前の実装(user_listの線形探索)の1回あたりの時間
+    - 多数のidを /users/{user_id} で1件ずつ取得する場合と、/users?ids=... で1回で取得する場合の時間
+を計測する。リクエストはネットワークを使わず、ASGIアプリを直接呼び出す。
+
+fastapi_path_parameter ディレクトリで実行する:
+    python benchmark.py
+    python benchmark.py --users 100000 --batch 500
+"""
+import argparse
+import asyncio
+import random
+import time
+import httpx
+import data
+from data import User, index_users
+from main import app
+
+def scan(users: list[User], user_id: int):
+    for user in users:
+        if user.id == user_id:
+            return user
+    return None
+
+def bench_lookup(users: list[User], ids: list[int]) -> tuple[float, float]:
+    started = time.perf_counter()
+    for user_id in ids:
+        scan(users, user_id)
+    scan_us = (time.perf_counter() - started) / len(ids) * 1_000_000
+    started = time.perf_counter()
+    for user_id in ids:
+        data.get_user(user_id)
+    index_us = (time.perf_counter() - started) / len(ids) * 1_000_000
+    return scan_us, index_us
+
+async def bench_requests(ids: list[int], rounds: int) -> tuple[float, float]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for user_id in ids:
+                response = await client.get(f"/users/{user_id}")
+                response.raise_for_status()
+        single_ms = (time.perf_counter() - started) / rounds * 1000
+
+        query = ",".join(map(str, ids))
+        started = time.perf_counter()
+        for _ in range(rounds):
+            response = await client.get("/users", params={"ids": query})
+            response.raise_for_status()
+        batch_ms = (time.perf_counter() - started) / rounds * 1000
+    assert len(response.json()["users"]) == len(ids)
+    return single_ms, batch_ms
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ユーザー取得の計測")
+    parser.add_argument("--users", type=int, default=10_000, help="ユーザーの件数")
+    parser.add_argument("--batch", type=int, default=200, help="まとめて取得するidの数")
+    parser.add_argument("--rounds", type=int, default=5, help="リクエストの計測の繰り返し回数")
+    args = parser.parse_args()
+
+    users = [User(id=user_id, name=f"user{user_id}") for user_id in range(1, args.users + 1)]
+    data.user_list = users
+    data.users_by_id = index_users(users)
+
+    rng = random.Random(0)
+    ids = rng.sample(range(1, args.users + 1), args.batch)
+    scan_us, index_us = bench_lookup(users, ids)
+    print(f"取得({args.users}件から1件): 線形探索 {scan_us:.2f}µs, 索引 {index_us:.2f}µs")
+    single_ms, batch_ms = asyncio.run(bench_requests(ids, args.rounds))
+    print(f"{args.batch}件の取得: 1件ずつ {single_ms:.2f}ms, まとめて {batch_ms:.2f}ms ({single_ms / batch_ms:.1f}x)")
@@ -1,3 +1,4 @@
+from collections.abc import Iterable
 from typing import Optional
 
 class User:
@@ -11,8 +12,19 @@ user_list = [
     User(id=3, name="user3")
 ]
 
+def index_users(users: Iterable[User]) -> dict[int, User]:
+    """idをキーにした辞書を作る。idが重複する場合は、線形探索と同じく先にあるユーザーを使う"""
+    users_by_id: dict[int, User] = {}
+    for user in users:
+        users_by_id.setdefault(user.id, user)
+    return users_by_id
+
+# 読み込み時に1回だけ作り、リクエストごとにuser_listを走査しない
+users_by_id = index_users(user_list)
+
 def get_user(user_id: int) -> Optional[User]:
-    for user in user_list:
-        if user.id == user_id:
-            return user
-    return None
\ No newline at end of file
+    return users_by_id.get(user_id)
+
+def get_users(user_ids: Iterable[int]) -> list[Optional[User]]:
+    """ids の順にユーザーを返す。存在しないidの位置はNoneになる"""
+    return [users_by_id.get(user_id) for user_id in user_ids]
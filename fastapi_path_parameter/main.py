@@ -1,12 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse
 from typing import Optional
-from data import get_user, User
+from data import get_user, get_users, User
 
 app = FastAPI()
 
+# 1回のリクエストで取得できるidの上限
+MAX_BATCH_IDS = 1000
+
+def parse_ids(ids: str) -> list[int]:
+    """'1,2,3' 形式のidの一覧を、重複を除いて指定順のリストにする"""
+    try:
+        user_ids = [int(item) for item in ids.split(",") if item.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be comma-separated integers")
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=422, detail=f"ids must contain at most {MAX_BATCH_IDS} ids")
+    return user_ids
+
+@app.get("/users")
+async def read_users(ids: str = Query(..., description="カンマ区切りのユーザーid (例: 1,2,3)")) -> JSONResponse:
+    user_ids = parse_ids(ids)
+    users = []
+    not_found = []
+    for user_id, user in zip(user_ids, get_users(user_ids)):
+        if user is None:
+            not_found.append(user_id)
+        else:
+            users.append({"user_id": user.id, "username": user.name})
+    # 戻り値の検証・変換を通さず、一覧全体を1回でエンコードする
+    return JSONResponse({"users": users, "not_found": not_found})
+
 @app.get("/users/{user_id}")
 async def read_user(user_id: int) -> dict:
     user: Optional[User] = get_user(user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User Not Found")
-    return {"user_id": user.id, "username": user.name}
\ No newline at end of file
+    return {"user_id": user.id, "username": user.name}
@@ -0,0 +1,75 @@
+"""
+本の検索時間の計測(全件の走査と索引の比較)
+
+本の件数を増やしながら、カテゴリ・複数カテゴリ・タイトルの前方一致・ページングの
+1回あたりの時間を、全件をリスト内包表記で走査する実装と BookCatalog の索引で比較する。
+
+fastapi_query_parameter ディレクトリで実行する:
+    python benchmark.py
+    python benchmark.py --sizes 100000 1000000 --ops 200
+"""
+import argparse
+import random
+import time
+from itertools import islice
+from data import Book, BookCatalog
+
+CATEGORIES = ["technical", "comics", "magazine", "novel", "business", "travel", "cooking", "history"]
+
+def make_books(count: int, rng: random.Random) -> list[Book]:
+    return [
+        Book(id=str(book_id), title=f"本{rng.randrange(count):07d}", category=CATEGORIES[book_id % len(CATEGORIES)])
+        for book_id in range(1, count + 1)
+    ]
+
+def scan(books: list[Book], categories=None, title_prefix=None, limit=None, offset=0) -> list[Book]:
+    """以前の実装と同じく、毎回全件を走査して絞り込む"""
+    wanted = set(categories) if categories else None
+    result = [
+        book for book in books
+        if (wanted is None or book.category in wanted)
+        and (not title_prefix or book.title.startswith(title_prefix))
+    ]
+    stop = None if limit is None else offset + limit
+    return list(islice(result, offset, stop))
+
+def per_op_us(func, kwargs_list: list[dict]) -> float:
+    started = time.perf_counter()
+    for kwargs in kwargs_list:
+        func(**kwargs)
+    return (time.perf_counter() - started) / len(kwargs_list) * 1_000_000
+
+QUERIES = {
+    "カテゴリ": lambda rng: {"categories": [rng.choice(CATEGORIES)], "limit": 50},
+    "複数カテゴリ": lambda rng: {"categories": rng.sample(CATEGORIES, 3), "limit": 50, "offset": 100},
+    "前方一致": lambda rng: {"title_prefix": f"本{rng.randrange(10000):04d}"},
+    "前方一致+カテゴリ": lambda rng: {"title_prefix": f"本{rng.randrange(100):02d}", "categories": [rng.choice(CATEGORIES)], "limit": 50},
+}
+
+def bench(size: int, ops: int, rng: random.Random) -> dict[str, tuple[float, float]]:
+    books = make_books(size, rng)
+    started = time.perf_counter()
+    catalog = BookCatalog(books)
+    print(f"{size}件の索引の作成: {time.perf_counter() - started:.2f}s")
+    result = {}
+    for name, make_query in QUERIES.items():
+        queries = [make_query(rng) for _ in range(ops)]
+        # 両方の実装が同じ結果を返すことを確かめてから計測する
+        for query in queries[:5]:
+            assert [book.id for book in scan(books, **query)] == [book.id for book in catalog.find(**query)]
+        result[name] = (per_op_us(lambda **query: scan(books, **query), queries), per_op_us(catalog.find, queries))
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BookCatalogの検索時間の計測")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="計測する本の件数")
+    parser.add_argument("--ops", type=int, default=100, help="検索ごとの実行回数")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for size in args.sizes:
+        result = bench(size, args.ops, rng)
+        print(f"{'検索':<12}{'走査':>14}{'索引':>14}{'倍率':>10}")
+        for name, (scan_us, index_us) in result.items():
+            print(f"{name:<12}{scan_us:>12.2f}µs{index_us:>12.2f}µs{scan_us / index_us:>9.1f}x")
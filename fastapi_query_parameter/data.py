@@ -1,3 +1,7 @@
+import bisect
+import heapq
+from collections.abc import Iterable
+from itertools import islice
 from typing import Optional
 
 class Book:
@@ -6,19 +10,143 @@ class Book:
         self.title = title
         self.category = category
 
-books = [
+class BookCatalog:
+    """
+        本の一覧と絞り込み用の索引
+        カテゴリ別の索引とタイトル順の索引を追加・削除のたびに更新し、検索のたびに全件を走査しないようにする。
+        結果はいずれも登録順で返す
+    """
+
+    def __init__(self, books: Iterable[Book] = ()):
+        # 登録順の番号 → 本(番号は単調に増えるため、辞書の順序がそのまま登録順になる)
+        self._by_order: dict[int, Book] = {}
+        self._order: dict[str, int] = {}
+        self._next_order = 0
+        # カテゴリ → そのカテゴリの本の登録順の番号(昇順)
+        self._by_category: dict[str, list[int]] = {}
+        # (タイトル, 登録順の番号) の昇順。前方一致する範囲を二分探索で求める
+        self._titles: list[tuple[str, int]] = []
+        # 追加・削除のたびに増やす。一覧のキャッシュが古くなったことをこれで判断する
+        self.version = 0
+        # 初期データは1件ずつ挿入せず、まとめて並べてから1回だけソートする。idが重複する場合は後の本を使う
+        latest: dict[str, Book] = {}
+        for book in books:
+            latest[book.id] = book
+        for book in latest.values():
+            order = self._next_order
+            self._next_order += 1
+            self._order[book.id] = order
+            self._by_order[order] = book
+            self._by_category.setdefault(book.category, []).append(order)
+            self._titles.append((book.title, order))
+        self._titles.sort()
+
+    def __len__(self) -> int:
+        return len(self._by_order)
+
+    def add(self, book: Book) -> None:
+        """本を追加する。同じidの本があれば、登録順を変えずに置き換える"""
+        order = self._order.get(book.id)
+        if order is None:
+            order = self._next_order
+            self._next_order += 1
+            self._order[book.id] = order
+        else:
+            self._unindex(order, self._by_order[order])
+        self._by_order[order] = book
+        bisect.insort(self._by_category.setdefault(book.category, []), order)
+        bisect.insort(self._titles, (book.title, order))
+        self.version += 1
+
+    def remove(self, book_id: str) -> Optional[Book]:
+        order = self._order.pop(book_id, None)
+        if order is None:
+            return None
+        book = self._by_order.pop(order)
+        self._unindex(order, book)
+        self.version += 1
+        return book
+
+    def _unindex(self, order: int, book: Book) -> None:
+        orders = self._by_category[book.category]
+        del orders[bisect.bisect_left(orders, order)]
+        if not orders:
+            del self._by_category[book.category]
+        del self._titles[bisect.bisect_left(self._titles, (book.title, order))]
+
+    def _title_range(self, prefix: str) -> tuple[int, int]:
+        """タイトルが prefix で始まる本の、タイトル順の索引上の範囲を返す"""
+        start = bisect.bisect_left(self._titles, (prefix,))
+        # prefixで始まる文字列は、prefixの後ろに最大のコードポイントを付けた文字列より前に並ぶ
+        end = bisect.bisect_left(self._titles, (prefix + "\U0010ffff",), start)
+        return start, end
+
+    def find(
+        self,
+        categories: Optional[list[str]] = None,
+        title_prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        ) -> list[Book]:
+        """
+            条件に合う本を登録順に返す関数
+            Args:
+                categories(Optional[list[str]]): いずれかのカテゴリに一致する本に絞り込む
+                title_prefix(Optional[str]): タイトルがこの文字列で始まる本に絞り込む
+                limit(Optional[int]): 返す最大の件数(Noneの場合はすべて)
+                offset(int): 先頭から読み飛ばす件数
+            Returns:
+                list[Book]: 条件に合う本
+        """
+        wanted = set(categories) if categories else None
+        orders: Iterable[int]
+        if title_prefix:
+            start, end = self._title_range(title_prefix)
+            if wanted is not None and self._category_scan_cost(wanted, end - start, limit, offset) < end - start:
+                # カテゴリの索引を登録順にたどってタイトルを確かめる。limitがあれば必要な件数で止まる
+                orders = (
+                    order for order in self._category_orders(wanted)
+                    if self._by_order[order].title.startswith(title_prefix)
+                )
+            else:
+                orders = sorted(
+                    order for _, order in self._titles[start:end]
+                    if wanted is None or self._by_order[order].category in wanted
+                )
+        elif wanted is not None:
+            orders = self._category_orders(wanted)
+        else:
+            orders = self._by_order.keys()
+
+        stop = None if limit is None else offset + limit
+        return [self._by_order[order] for order in islice(orders, offset, stop)]
+
+    def _category_scan_cost(self, categories: set[str], title_matches: int,
+                            limit: Optional[int], offset: int) -> float:
+        """カテゴリの索引をたどってタイトルを確かめる場合に、確かめるおおよその件数"""
+        count = sum(len(self._by_category.get(category, ())) for category in categories)
+        if limit is None or title_matches == 0:
+            return count
+        # タイトルの一致する割合がカテゴリによらないとみなし、offset + limit 件見つかるまでの件数を見積もる
+        return min(count, (offset + limit) * len(self) / title_matches)
+
+    def _category_orders(self, categories: set[str]) -> Iterable[int]:
+        indexes = [self._by_category[category] for category in categories if category in self._by_category]
+        if len(indexes) == 1:
+            return indexes[0]
+        # 各カテゴリの索引は昇順なので、マージすれば登録順になる
+        return heapq.merge(*indexes)
+
+catalog = BookCatalog([
     Book(id="1", title="Python入門", category="technical"),
     Book(id="2", title="はじめてのプログラミング", category="technical"),
     Book(id="3", title="すすむ巨人", category="comics"),
     Book(id="4", title="DBおやじ", category="comics"),
     Book(id="5", title="週刊ダイヤモンド", category="magazine"),
-    Book(id="6", title="ザ・社長", category="magazine"),    
-]
+    Book(id="6", title="ザ・社長", category="magazine"),
+])
 
 def get_books_by_category(
     category: Optional[str] = None
     ) -> list[Book]:
-    if category is None:
-        return books
-    else:
-        return [book for book in books if book.category == category]
\ No newline at end of file
+    return catalog.find(categories=[category] if category is not None else None)
@@ -1,19 +1,40 @@
+import json
 from socket import gaierror
 from token import OP
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request, Response
 from typing import Optional
-from data import get_books_by_category
+from data import catalog
+from response_cache import book_responses
 
 app = FastAPI()
 
 @app.get("/books/")
 async def read_books(
-    category: Optional[str] = None
-    ) -> list[dict[str, str]]:
-    result = get_books_by_category(category)
-    
-    return [{
-        "id": book.id,
-        "title": book.title,
-        "category": book.category
-        } for book in result]
\ No newline at end of file
+    request: Request,
+    # ?category=comics&category=magazine のように複数指定できる
+    category: Optional[list[str]] = Query(None),
+    title_prefix: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    ) -> Response:
+    def encode() -> bytes:
+        result = catalog.find(
+            categories=category,
+            title_prefix=title_prefix,
+            limit=limit,
+            offset=offset,
+        )
+        return json.dumps([{
+            "id": book.id,
+            "title": book.title,
+            "category": book.category
+            } for book in result], ensure_ascii=False, separators=(",", ":")).encode()
+
+    # カテゴリの指定順や重複は結果に影響しないため、キーでは並べ替えて1つにまとめる
+    key = (tuple(sorted(set(category))) if category else None, title_prefix or None, limit, offset)
+    cached = book_responses.get(catalog.version, key, encode)
+    # カタログは変わりうるため、クライアントには毎回ETagで確認させる
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if cached.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
@@ -0,0 +1,60 @@
+"""
+一覧レスポンスのキャッシュ
+
+本の一覧をJSONにエンコードしたバイト列を、検索条件ごとに保持する。
+カタログの version が変わったら全件を捨てるため、変更後に古い一覧を返すことはない。
+ETag は本文のハッシュから作る強いETagで、If-None-Match が一致すれば本文を送らずに 304 を返す。
+"""
+import hashlib
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Optional
+from cachetools import LRUCache
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """If-None-Matchヘッダーの値がこのレスポンスのETagと一致するかを返す"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # If-None-Matchは弱い比較を行うため、W/ を外して比べる
+        return any(tag.strip().removeprefix("W/") == self.etag for tag in if_none_match.split(","))
+
+class ResponseCache:
+    """エンコード済みの一覧を検索条件をキーにして保持するLRUキャッシュ"""
+
+    def __init__(self, maxsize: int = 1024):
+        self._entries: LRUCache = LRUCache(maxsize)
+        self._version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: int, key: Hashable, encode: Callable[[], bytes]) -> CachedResponse:
+        """
+            キーに対応するレスポンスを返す関数。なければ encode で作って保持する
+            Args:
+                version(int): カタログの現在の版。前回と異なればキャッシュを空にする
+                key(Hashable): 検索条件
+                encode(Callable[[], bytes]): 一覧をJSONにエンコードする関数
+            Returns:
+                CachedResponse: 本文とETag
+        """
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        body = encode()
+        entry = CachedResponse(body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+        self._entries[key] = entry
+        return entry
+
+book_responses = ResponseCache()